@@ -0,0 +1,72 @@
+import sys
+from queue import Empty, Full, Queue
+from threading import Thread
+
+# Max number of events waiting for the worker, events that don't fit are dropped and counted
+ACTION_QUEUE_SIZE = 10000
+
+# Max number of events written with a single write
+ACTION_BATCH = 256
+
+
+"""
+Runs print actions of rules in a worker thread, so neither rendering nor a slow terminal or log stall the packet loop.
+The loop only puts a (rule, packet, key, obj) record into a bounded queue, the packet being pkt.freeze(): a copy
+the loop doesn't change afterwards (a lazy packet is copied as its frame and decoded by the worker).
+The worker renders records with Rule.render, takes all that are ready (up to batch) and writes them at once.
+Events that don't fit into the queue are dropped and counted in dropped
+"""
+class ActionQueue:
+    def __init__(self, out=None, size=ACTION_QUEUE_SIZE, batch=ACTION_BATCH):
+        # None means sys.stdout at the time of writing
+        self.out = out
+        self.queue = Queue(size)
+        self.batch = batch
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.worker = Thread(target=self.run, name='actions', daemon=True)
+        self.worker.start()
+
+    def put(self, rule, pkt, key, obj):
+        if self.queue.full():
+            self.dropped += 1
+            return
+        try:
+            self.queue.put_nowait((rule, pkt.freeze(), key, obj))
+        except Full:
+            self.dropped += 1
+
+    def run(self):
+        while True:
+            events = [self.queue.get()]
+            while len(events) < self.batch:
+                try:
+                    events.append(self.queue.get_nowait())
+                except Empty:
+                    break
+            texts = []
+            for event in events:
+                if event is None:
+                    continue
+                rule, pkt, key, obj = event
+                try:
+                    texts.append(rule.render(pkt, key, obj))
+                except Exception as e:
+                    self.failed += 1
+                    texts.append(f'WARNING: action of rule {rule.name} failed: {e!r}')
+            if texts:
+                out = self.out or sys.stdout
+                out.write('\n'.join(texts) + '\n')
+                out.flush()
+                self.written += len(texts)
+            if None in events:
+                return
+
+    # Writes everything that's already queued and stops the worker
+    def close(self):
+        self.queue.put(None)
+        self.worker.join()
+
+    def report(self):
+        return f'{self.written} actions written, {self.dropped} dropped, {self.failed} failed'
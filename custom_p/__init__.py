@@ -2,9 +2,8 @@ from datetime import datetime
 import json
 import timeit
 from collections import OrderedDict
-from decimal import Decimal
 
-from extensions import Session, Rule, COMPARISONS, ipv4_to_int, mac_to_int
+from extensions import NS_PER_SECOND, Session, Rule, RuleNetwork, attr_accessor, attr_source, ipv4_to_int, mac_to_int, decode_value
 
 from .network_protocols import *
 
@@ -30,44 +29,53 @@ fields_values_decoder = {
 }
 
 
-def do(path, rules):
+# If manager (see RuleManager) is given, it's polled between packets and rules are swapped when its file changes.
+# If queue (see ActionQueue) is given, print actions are written by its worker thread.
+# If profiler (see Profiler) is given, it counts conditions and times parsing, matching and actions. compiled is ignored
+def do(path, rules, compiled=False, debug=False, manager=None, queue=None, profiler=None):
 
     for rule in rules:
-        for cond in rule.conditions:
-            cond.val = fields_values_decoder.get(cond.pth, lambda a: a)(cond.val)
+        prepare_rule(rule, queue)
+    if manager:
+        manager.bind(lambda rule: prepare_rule(rule, queue))
+    network, match = build(rules, compiled, debug, profiler)
+    parse = profiler.parse(Packet.from_raw) if profiler else Packet.from_raw
     s = Session(path)
     start = timeit.default_timer()
     for pkt in s:
-        pkt = Packet.from_raw(*pkt)
-        for rule in rules:
-            rule_matched = True
-            for cond in rule.conditions:
-                obj = pkt
-                for step in cond.pth.split('.'):
-                    obj = getattr(obj, step, None)
-                if (a := cond.act) in COMPARISONS:
-                    condition_matched = COMPARISONS[a](obj, cond.val)
-                else:
-                    print(f'WARNING: unknown condition in rule {rule.name}: {cond}')
-                    condition_matched = False
-                if not condition_matched:
-                    rule_matched = False
-                    break
-            if rule_matched:
-                rule.do(pkt)
+        if manager and manager.poll() is not None:
+            network, match = build(manager.rules, compiled, debug, profiler)
+        pkt = parse(*pkt)
+        for rule in match(pkt):
+            rule.do(pkt)
     return timeit.default_timer() - start
     #for rule in rules:
     #    for i in rule.report(*report):
     #        print(i, end='')
 
 
+# Converts values of the rule into the form parsers produce. Done once for every rule
+def prepare_rule(rule, queue=None):
+    for cond in rule.conditions:
+        cond.val = decode_value(cond, fields_values_decoder)
+    rule.bind(attr_accessor, queue)
+
+
+# Returns network of the rules and its matcher
+def build(rules, compiled=False, debug=False, profiler=None):
+    network = RuleNetwork(rules, attr_accessor, lambda pkt: pkt.p, get_all_full_names())
+    if profiler:
+        return network, profiler.match(network)
+    return network, (network.compile(attr_source, 'pkt.p', debug) if compiled else network.match)
+
+
 class Packet(OrderedDict):
     ll_type = None
     time = None
     data = None
     p = None
 
-    def set_meta(self, ll_type: int, time: Decimal, p: []):
+    def set_meta(self, ll_type: int, time: int, p: []):
         self.ll_type = ll_type
         self.time = time
         self.p = p
@@ -76,8 +84,11 @@ class Packet(OrderedDict):
         return {name.lower(): value.get_all_fields(repr=repr) for name, value in self.items()}
 
     def get_time(self):
-        # TODO check usages and make everything use Decimal so we don't lose precision
-        return float(self.time)
+        return self.time / NS_PER_SECOND
+
+    # Packets are complete once parsed and never change, the ActionQueue worker can render this one as it is
+    def freeze(self):
+        return self
 
     def summary(self) -> str:
         summary = f"[{datetime.fromtimestamp(self.get_time())}]"
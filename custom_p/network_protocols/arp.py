@@ -1,6 +1,10 @@
 import struct
 import extensions
 
+# --- generated from pcc_in.json: header ---
+_HEADER = struct.Struct('!HHBBH6sI6sI')
+# --- end of generated header ---
+
 
 class Arp:
     name = 'arp'
@@ -83,34 +87,24 @@ class Arp:
     def summary(self):
         return f'ARP {self.get_sender_ip()} -> {self.get_target_ip()}'
 
+    # --- generated from pcc_in.json: from_raw ---
     @classmethod
     def from_raw(cls, data):
-        # initialize
-        hardware_type = None
-        protocol_type = None
-        hardware_size = None
-        protocol_size = None
-        opcode = None
-        sender_mac = None
-        sender_ip = None
-        target_mac = None
-        target_ip = None
-
-        if len(data) < 18:
+        if len(data) < 28:
             return extensions.MalformedPacketException(f"ARP requires at least 28 bytes, got {len(data)}")
-        
-        # get values for fields the packet has
-        hardware_type, protocol_type, hardware_size, protocol_size, opcode, \
-        sender_mac, sender_ip, target_mac, target_ip = struct.unpack('!HHBBH6sI6sI', data[:28])
 
+        # get values for fields the packet has
+        hardware_type, protocol_type, hardware_size, protocol_size, opcode, sender_mac, sender_ip, target_mac, \
+        target_ip = _HEADER.unpack_from(data)
         sender_mac = int.from_bytes(sender_mac, 'big')
         target_mac = int.from_bytes(target_mac, 'big')
 
-        # save payload
         # if we know the next proto, parse the payload
         payload = data[28:]
 
-        return cls(hardware_type, protocol_type, hardware_size, protocol_size, opcode, sender_mac, sender_ip, target_mac, target_ip, payload)
+        return cls(hardware_type, protocol_type, hardware_size, protocol_size, opcode, sender_mac, sender_ip,
+                   target_mac, target_ip, payload)
+    # --- end of generated from_raw ---
 
     @classmethod
     def from_dict(cls, cond):
@@ -4,6 +4,12 @@ import extensions
 from .dot11_management import Dot11Management
 from .llc import Llc
 
+_HEADER = struct.Struct('!2sH6s')
+_ADDRESSES = struct.Struct('!6s6sH')
+_MAC = struct.Struct('6s')
+_QOS_CONTROL = struct.Struct('2s')
+_CCMP = struct.Struct('8s')
+
 
 class Dot11Header:
     name = 'dot11_header'
@@ -266,7 +272,7 @@ class Dot11Header:
             return extensions.MalformedPacketException(f".11 requires at least 10 bytes, got {len(data)}")
 
         # get values for fields the packet has
-        frame_control, duration, receiver = struct.unpack('!2sH6s', data[:10])
+        frame_control, duration, receiver = _HEADER.unpack_from(data)
         frame_control = cls.FrameControl.from_raw(frame_control)
         receiver = int.from_bytes(receiver, 'big')
         transmitter = None
@@ -284,12 +290,12 @@ class Dot11Header:
         elif frame_control.type == 1 and (frame_control.subtype == 8 or
                                           frame_control.subtype == 10 or
                                           frame_control.subtype == 11):
-            transmitter = int.from_bytes(struct.unpack('!6s', data[10:16])[0], 'big')
+            transmitter = int.from_bytes(_MAC.unpack_from(data, 10)[0], 'big')
             last = 16
         else:
             # TODO: remove exception when we account for all frame types
             try:
-                transmitter, destination, sequence_fragment = struct.unpack('!6s6sH', data[10:24])
+                transmitter, destination, sequence_fragment = _ADDRESSES.unpack_from(data, 10)
             except Exception:
                 print(f'type: {frame_control.type} subtype: {frame_control.subtype}')
             transmitter = int.from_bytes(transmitter, 'big')
@@ -297,16 +303,16 @@ class Dot11Header:
             sequence_number = sequence_fragment >> 4
             fragment_number = sequence_fragment & 15
             if frame_control.to_ds and frame_control.from_ds:
-                address_4 = int.from_bytes(struct.unpack('!6s', data[24:30])[0], 'big')
+                address_4 = int.from_bytes(_MAC.unpack_from(data, 24)[0], 'big')
                 last = 30
             else:
                 last = 24
 
         if frame_control.type == 2 and frame_control.subtype == 8:
-            qos_control = cls.QosControl.from_raw(struct.unpack('!2s', data[last:last + 2])[0])
+            qos_control = cls.QosControl.from_raw(_QOS_CONTROL.unpack_from(data, last)[0])
             last += 2
         if frame_control.protected:
-            ccmp = cls.Ccmp.from_raw(struct.unpack('<8s', data[last:last + 8])[0])
+            ccmp = cls.Ccmp.from_raw(_CCMP.unpack_from(data, last)[0])
             last += 8
 
         # save payload
@@ -1,6 +1,18 @@
 import struct
 import extensions
 
+_ASSOCIATION_REQUEST = struct.Struct('<2sH')
+_ASSOCIATION_RESPONSE = struct.Struct('<2sHH')
+_REASSOCIATION_REQUEST = struct.Struct('<2sH6s')
+_BEACON = struct.Struct('<QH2s')
+_REASON_CODE = struct.Struct('<H')
+_AUTHENTICATION = struct.Struct('<HHH')
+_BLOCK_ACK = struct.Struct('<BHHH')
+_DELBA = struct.Struct('<HH')
+_MEASUREMENT_REQUEST = struct.Struct('<BH')
+_ACTION = struct.Struct('<BB')
+_TAG = struct.Struct('!BB')
+
 
 class Dot11Management:
     name = 'dot11_management'
@@ -196,28 +208,28 @@ class Dot11Management:
             last = 0
 
             if subtype == 0:  # association request
-                capabilities_information, listen_interval = struct.unpack('<2sH', data[:4])
+                capabilities_information, listen_interval = _ASSOCIATION_REQUEST.unpack_from(data)
                 capabilities_information = cls.CapabilitiesInformation.from_raw(capabilities_information)
                 last = 4
             elif subtype == 1:  # association response
-                capabilities_information, status_code, association_id = struct.unpack('<2sHH', data[:6])
+                capabilities_information, status_code, association_id = _ASSOCIATION_RESPONSE.unpack_from(data)
                 capabilities_information = cls.CapabilitiesInformation.from_raw(capabilities_information)
                 association_id = association_id & 16383  # 14 bits
                 last = 6
             elif subtype == 2:  # reassociation request
-                capabilities_information, listen_interval, current_ap = struct.unpack('<2sH6s', data[:10])
+                capabilities_information, listen_interval, current_ap = _REASSOCIATION_REQUEST.unpack_from(data)
                 capabilities_information = cls.CapabilitiesInformation.from_raw(capabilities_information)
                 current_ap = int.from_bytes(current_ap, 'big')
                 last = 10
             elif subtype == 3:  # reassociation response
-                capabilities_information, status_code, association_id = struct.unpack('<2sHH', data[:6])
+                capabilities_information, status_code, association_id = _ASSOCIATION_RESPONSE.unpack_from(data)
                 capabilities_information = cls.CapabilitiesInformation.from_raw(capabilities_information)
                 association_id = association_id & 16383  # 14 bits
                 last = 6
             elif subtype == 4:  # probe request
                 pass
             elif subtype == 5:  # probe response
-                timestamp, beacon_interval, capabilities_information = struct.unpack('<QH2s', data[:12])
+                timestamp, beacon_interval, capabilities_information = _BEACON.unpack_from(data)
                 capabilities_information = cls.CapabilitiesInformation.from_raw(capabilities_information)
                 last = 12
             elif subtype == 6:
@@ -225,19 +237,19 @@ class Dot11Management:
             elif subtype == 7:
                 pass
             elif subtype == 8:  # beacon
-                timestamp, beacon_interval, capabilities_information = struct.unpack('<QH2s', data[:12])
+                timestamp, beacon_interval, capabilities_information = _BEACON.unpack_from(data)
                 capabilities_information = cls.CapabilitiesInformation.from_raw(capabilities_information)
                 last = 12
             elif subtype == 9:
                 pass
             elif subtype == 10:  # disassociation
-                reason_code = struct.unpack('<H', data[:2])[0]
+                reason_code = _REASON_CODE.unpack_from(data)[0]
                 last = 2
             elif subtype == 11:  # authentication
-                authentication_algorithm, authentication_seq, status_code = struct.unpack('<HHH', data[:6])
+                authentication_algorithm, authentication_seq, status_code = _AUTHENTICATION.unpack_from(data)
                 last = 6
             elif subtype == 12:  # deauthentication
-                reason_code = struct.unpack('<H', data[:2])[0]
+                reason_code = _REASON_CODE.unpack_from(data)[0]
                 last = 2
             elif subtype == 13:
                 action, data = cls.Action.from_raw(data)
@@ -364,28 +376,26 @@ class Dot11Management:
                 action_code = None
                 
                 # get values for fields the packet has
-                category_code, action_code = struct.unpack('<BB', data[:2])
+                category_code, action_code = _ACTION.unpack_from(data)
                 data = data[2:]
                 if category_code == 3:
                     if action_code == 0:
-                        dialog_token, block_ack_parameters, block_ack_timeout, block_ack_ssc = struct.unpack('<BHHH',
-                                                                                                             data[:7])
+                        dialog_token, block_ack_parameters, block_ack_timeout, block_ack_ssc = _BLOCK_ACK.unpack_from(data)
                         data = data[7:]
                     elif action_code == 1:
-                        dialog_token, status_code, block_ack_parameters, block_ack_timeout = struct.unpack('<BHHH',
-                                                                                                           data[:7])
+                        dialog_token, status_code, block_ack_parameters, block_ack_timeout = _BLOCK_ACK.unpack_from(data)
                         data = data[7:]
                     elif action_code == 2:
-                        delete_block_ack, reason_code = struct.unpack('<HH', data[:4])
+                        delete_block_ack, reason_code = _DELBA.unpack_from(data)
                         data = data[4:]
                     else:
                         data = b''
                 elif category_code == 5:
                     if action_code == 0:
-                        dialog_token, repetitions = struct.unpack('<BH', data[:3])
+                        dialog_token, repetitions = _MEASUREMENT_REQUEST.unpack_from(data)
                         data = data[3:]
                     elif action_code == 4:
-                        dialog_token = struct.unpack('<B', data[:1])[0]
+                        dialog_token = data[0]
                         data = data[1:]
                     else:
                         data = b''
@@ -443,16 +453,16 @@ class Dot11Management:
             tags = {}
             while data:
                 try:
-                    tag_number, tag_length = struct.unpack('!BB', data[:2])
+                    tag_number, tag_length = _TAG.unpack_from(data)
                     try:
-                        tag_value = struct.unpack(f'!{tag_length}s', data[2:tag_length + 2])[0]
+                        tag_value = extensions.read_bytes(data, 2, tag_length)
                     except struct.error as e:
                         #return extensions.MalformedPacketException(f"Is packet malformed? Couldn't unpack: {e}")
-                        tag_value = struct.unpack(f'!{len(data)}s', data)[0]
+                        tag_value = data
                 except:
                     tag_number = 256
                     tag_length = 256
-                    tag_value = struct.unpack(f'!{len(data)}s', data)[0]
+                    tag_value = data
                 tags[tag_number] = (tag_length, tag_value)
                 # TODO: account for vendor-specific
                 data = data[tag_length + 2:]
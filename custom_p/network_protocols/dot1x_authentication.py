@@ -3,6 +3,9 @@ import extensions
 
 from .eap import Eap
 
+_HEADER = struct.Struct('!BBH')
+_KEY = struct.Struct('!B2sHQ32s16s8s8s16sH')
+
 class Dot1xAuthentication:
     name = 'dot1x_authentication'
 
@@ -126,19 +129,17 @@ class Dot1xAuthentication:
         if len(data) < 4:
             return extensions.MalformedPacketException(f"1x_auth requires at least 4 bytes, got {len(data)}")
 
-        version, type, length = struct.unpack('!BBH', data[:4])
+        version, type, length = _HEADER.unpack_from(data)
         data = data[4:length + 4]
 
         if type == 0:  # EAP packet
             payload = Eap.from_raw(data)
 
         elif type == 3:  # key
-            key_descriptor_type, key_information, key_length, replay_counter = struct.unpack('!B2sHQ', data[:13])
+            key_descriptor_type, key_information, key_length, replay_counter, \
+            wpa_key_nonce, key_iv, wpa_key_rsc, wpa_key_id, wpa_key_mic, wpa_key_data_length = _KEY.unpack_from(data)
             key_information = cls.KeyInformation.from_raw(key_information)
-            data = data[13:]
-            wpa_key_nonce, key_iv, wpa_key_rsc, wpa_key_id, wpa_key_mic, wpa_key_data_length = struct.unpack(
-                '!32s16s8s8s16sH', data[:82])
-            data = data[82:]
+            data = data[_KEY.size:]
             if wpa_key_data_length:
                 wpa_key_data = cls.WpaKeyData.from_raw(data[:wpa_key_data_length])
             payload = data[wpa_key_data_length:]
@@ -253,7 +254,7 @@ class Dot1xAuthentication:
             
         @classmethod
         def from_raw(cls, data):
-            data = struct.unpack(f'!{len(data)}s', data)
+            data = (data,)
             return cls(data)
 
         @classmethod
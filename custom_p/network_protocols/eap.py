@@ -1,6 +1,9 @@
 import struct
 import extensions
 
+_HEADER = struct.Struct('!BBH')
+_TLS_LENGTH = struct.Struct('!I')
+
 
 class Eap:
     name = 'eap'
@@ -92,18 +95,18 @@ class Eap:
             return extensions.MalformedPacketException(f"EAP requires at least 4 bytes, got {len(data)}")
         
         # get values for fields the packet has
-        code, id, length = struct.unpack('!BBH', data[:4])
+        code, id, length = _HEADER.unpack_from(data)
         data = data[4:]
         if length > 4:
-            type = struct.unpack('!B', data[:1])[0]
+            type = data[0]
 
             if type == 1:
-                identity = struct.unpack(f'!{length-5}s', data[1:length])[0]
+                identity = extensions.read_bytes(data, 1, length - 5)
                 data = data[length:]
             elif type == 25:
                 tls_flags = cls.TlsFlags.from_raw(data[1:2])
                 if tls_flags.length_included:
-                    tls_length = struct.unpack('!I', data[2:6])[0]
+                    tls_length = _TLS_LENGTH.unpack_from(data, 2)[0]
                     data = data[6:]
                 else:
                     data = data[1:]
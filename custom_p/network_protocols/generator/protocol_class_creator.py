@@ -241,8 +241,11 @@ def fill_protos(a, path, replace=False):
                 f.write(t)
 
 
-with open('pcc_in.json') as f:
-    a = json.loads(f.read())
-    path = Path().resolve().parent
-    fill_info(a, path)
-    fill_protos(a, path, replace=False)
+if __name__ == '__main__':
+    with open('pcc_in.json') as f:
+        # $-prefixed keys describe the wire format for protocol_parser_creator.py and aren't fields
+        a = {proto: {k: v for k, v in fields.items() if not k.startswith('$')}
+             for proto, fields in json.loads(f.read()).items()}
+        path = Path().resolve().parent
+        fill_info(a, path)
+        fill_protos(a, path, replace=False)
@@ -0,0 +1,199 @@
+import builtins
+import json
+import keyword
+from pathlib import Path
+from struct import calcsize
+
+from protocol_class_creator import to_camelcase
+
+# Generated code replaces whatever is between these lines, the rest of the file is left as written
+START = '# --- generated from pcc_in.json: {} ---'
+END = '# --- end of generated {} ---'
+WIDTH = 120
+
+
+# Splits the "header" of a $parser spec into the merged struct format, its size, names of the unpacked words
+# and (field, word index, shift, width, word bits, kind) of every field. Bitfield words are {field: bits, ...}, msb first
+def layout(spec: dict) -> (str, int, list, list):
+    fmt = '!' + ''.join(code for _, code, *_ in spec['header'])
+    words = []
+    fields = []
+    for i, (name, code, *kind) in enumerate(spec['header']):
+        if isinstance(name, dict):
+            total = shift = calcsize('!' + code) * 8
+            for field, width in name.items():
+                shift -= width
+                fields.append((field, i, shift, width, total, None))
+            words.append('_'.join(name))
+        else:
+            fields.append((name, i, 0, None, None, kind[0] if kind else None))
+            words.append(name)
+    return fmt, calcsize(fmt), words, fields
+
+
+def bits(word: str, shift: int, width: int, total: int) -> str:
+    mask = (1 << width) - 1
+    mask = mask if mask < 256 else hex(mask)
+    if shift + width == total:
+        return f'{word} >> {shift}'
+    if not shift:
+        return f'{word} & {mask}'
+    return f'({word} >> {shift}) & {mask}'
+
+
+# Local name for a field that is read back, builtins and keywords get an underscore
+def var(field: str) -> str:
+    return f'_{field}' if keyword.iskeyword(field) or hasattr(builtins, field) else field
+
+
+# Joins items into lines no longer than width, continuation lines start with indent
+def wrap(head: str, items: list, tail: str, indent: str, backslash=False, width=WIDTH) -> list:
+    lines = []
+    line = head
+    for i, item in enumerate(items):
+        piece = item + (', ' if i < len(items) - 1 else tail)
+        if len(line) + len(piece.rstrip()) + (2 if backslash else 0) > width and line != head:
+            lines.append(line.rstrip() + (' \\' if backslash else ''))
+            line = indent + piece
+        else:
+            line += piece
+    lines.append(line)
+    return lines
+
+
+def next_table(spec: dict, value) -> str:
+    return '{' + ', '.join(f'{k}: {value(v)}' for k, v in spec['next']['protocols'].items()) + '}'
+
+
+def dict_p_parser(name: str, spec: dict, specs: dict) -> list:
+    fmt, size, _, fields = layout(spec)
+    title = spec['title']
+    read_back = {spec.get('next', {}).get('field'), spec.get('length', {}).get('field'), spec.get('bound')}
+
+    lines = [f"_HEADER = Struct('{fmt}')"]
+    if 'next' in spec:
+        lines.append(f"_NEXT = {next_table(spec, lambda p: repr(specs.get(p, {}).get('dict_p_name', p)))}")
+    lines += ['', '',
+              f'def {name}(data: memoryview, offset: int = 0, need=None) -> (list, tuple):',
+              f'    if len(data) - offset < {size}:',
+              f"        return [], ('MALFORMED', f\"{title} requires at least {size} bytes, got {{len(data) - offset}}\")",
+              '',
+              '    t = _HEADER.unpack_from(data, offset)']
+    entries = []
+    for field, i, shift, width, total, _ in fields:
+        value = f't[{i}]' if width is None else bits(f't[{i}]', shift, width, total)
+        entries.append(f"('{field}', {var(field) + ' := ' if field in read_back else ''}{value})")
+    lines += [('    r = [' if i == 0 else ' ' * 9) + entry + (']' if i == len(entries) - 1 else ',')
+              for i, entry in enumerate(entries)]
+
+    end = f'offset + {size}'
+    if 'length' in spec:
+        lines += ['', f"    header_length = {var(spec['length']['field'])} * {spec['length']['scale']}"]
+        end = 'offset + header_length'
+        if tail := spec.get('tail'):
+            lines += [f"    if header_length > {size} and (need is None or '{tail}' in need):",
+                      '        if len(data) - offset >= header_length:',
+                      f"            r.append(('{tail}', (bytes(data[offset + {size}:offset + header_length]),)))",
+                      '        else:',
+                      f'            print(f"DEBUG got {tail} of incorrect size: expected {{header_length - {size}}} bytes, "',
+                      f'                  f"got {{len(data) - offset - {size}}}")',
+                      f"            r.append(('{tail}', (bytes(data[offset + {size}:]),)))"]
+
+    proto = f"_NEXT.get({var(spec['next']['field'])}, 'UNKNOWN')" if 'next' in spec else "'UNKNOWN'"
+    payload = f"data[:offset + {var(spec['bound'])}]" if 'bound' in spec else 'data'
+    lines += ['', f'    return r, ({proto}, {payload}, {end})']
+    return lines
+
+
+def class_header(spec: dict) -> list:
+    fmt, *_ = layout(spec)
+    lines = []
+    if 'next' in spec:
+        for proto in dict.fromkeys(spec['next']['protocols'].values()):
+            lines.append(f'from .{proto} import {to_camelcase(proto)}')
+        lines.append('')
+    lines.append(f"_HEADER = struct.Struct('{fmt}')")
+    if 'next' in spec:
+        lines.append(f'_NEXT = {next_table(spec, to_camelcase)}')
+    return lines
+
+
+def names(spec: dict) -> list:
+    _, _, _, fields = layout(spec)
+    return [field for field, *_ in fields] + ([spec['tail']] if 'tail' in spec else [])
+
+
+def class_slots(spec: dict) -> list:
+    return wrap('__slots__ = ', [f"'{name}'" for name in names(spec) + ['payload']], '', ' ' * 12, True, WIDTH - 4)
+
+
+def class_from_raw(spec: dict) -> list:
+    fmt, size, words, fields = layout(spec)
+    lines = ['@classmethod',
+             'def from_raw(cls, data):',
+             f'    if len(data) < {size}:',
+             f'        return extensions.MalformedPacketException(f"{spec["title"]} requires at least {size} bytes, '
+             f'got {{len(data)}}")',
+             '',
+             '    # get values for fields the packet has']
+    lines += wrap('    ', words, ' = _HEADER.unpack_from(data)', ' ' * 4, True, WIDTH - 4)
+    for field, i, shift, width, total, kind in fields:
+        if width is not None:
+            lines.append(f'    {field} = {bits(words[i], shift, width, total)}')
+        elif kind == 'mac':
+            lines.append(f"    {field} = int.from_bytes({field}, 'big')")
+
+    end = size
+    if 'length' in spec:
+        lines.append(f"    header_length = {spec['length']['field']} * {spec['length']['scale']}")
+        end = 'header_length'
+        if tail := spec.get('tail'):
+            lines += [f'    {tail} = None',
+                      f'    if header_length > {size}:',
+                      '        if len(data) >= header_length:',
+                      f'            {tail} = (data[{size}:header_length],)',
+                      '        else:',
+                      f'            print(f"DEBUG got {tail} of incorrect size: expected {{header_length - {size}}} bytes, "',
+                      f'                  f"got {{len(data) - {size}}}")',
+                      f'            {tail} = (data[{size}:],)']
+
+    lines += ['', '    # if we know the next proto, parse the payload']
+    if 'bound' in spec:
+        lines.append(f"    data = data[:{spec['bound']}]")
+    lines.append(f'    payload = data[{end}:]')
+    if 'next' in spec:
+        lines += [f"    if (next_proto := _NEXT.get({spec['next']['field']})) is not None:",
+                  '        payload = next_proto.from_raw(payload)']
+    lines += ['']
+    lines += wrap('    return cls(', names(spec) + ['payload'], ')', ' ' * 15, width=WIDTH - 4)
+    return lines
+
+
+# Replaces the body of every {region: lines} in the file, keeping its line endings and the region's indentation
+def fill(path: Path, regions: dict):
+    text = path.read_bytes().decode()
+    newline = '\r\n' if '\r\n' in text else '\n'
+    lines = text.split(newline)
+    for region, code in regions.items():
+        try:
+            start = next(i for i, line in enumerate(lines) if line.strip() == START.format(region))
+            end = next(i for i, line in enumerate(lines) if line.strip() == END.format(region))
+        except StopIteration:
+            raise ValueError(f'{path} has no generated {region} region')
+        indent = lines[start][:len(lines[start]) - len(lines[start].lstrip())]
+        lines[start + 1:end] = [indent + line if line else line for line in code]
+    path.write_bytes(newline.join(lines).encode())
+
+
+if __name__ == '__main__':
+    with open('pcc_in.json') as f:
+        specs = {proto.split('/')[0]: fields['$parser'] for proto, fields in json.loads(f.read()).items()
+                 if '$parser' in fields}
+    root = Path().resolve().parent.parent.parent
+    for proto, spec in specs.items():
+        name = spec.get('dict_p_name', proto)
+        fill(root / 'dict_p' / 'network_protocols' / f'{name}.py', {'parser': dict_p_parser(name, spec, specs)})
+        fill(root / 'custom_p' / 'network_protocols' / f'{proto}.py',
+             {'header': class_header(spec), 'from_raw': class_from_raw(spec)})
+        fill(root / 'slots_classes_p' / 'network_protocols' / f'{proto}.py',
+             {'header': class_header(spec), 'slots': class_slots(spec), 'from_raw': class_from_raw(spec)})
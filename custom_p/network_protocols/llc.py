@@ -1,10 +1,15 @@
 import struct
 import extensions
 
+# --- generated from pcc_in.json: header ---
 from .ipv4 import Ipv4
 from .arp import Arp
 from .dot1x_authentication import Dot1xAuthentication
 
+_HEADER = struct.Struct('!BBB3sH')
+_NEXT = {0x0800: Ipv4, 0x0806: Arp, 0x888e: Dot1xAuthentication}
+# --- end of generated header ---
+
 
 class Llc:
     name = 'llc'
@@ -56,33 +61,22 @@ class Llc:
     def summary(self):
         return False
 
+    # --- generated from pcc_in.json: from_raw ---
     @classmethod
     def from_raw(cls, data):
-        # initialize
-        dsap = None
-        ssap = None
-        control_field = None
-        organization_code = None
-        type = None
-
         if len(data) < 8:
             return extensions.MalformedPacketException(f"LLC requires at least 8 bytes, got {len(data)}")
-        
+
         # get values for fields the packet has
-        dsap, ssap, control_field, organization_code, type = struct.unpack('!BBB3sH', data[:8])
+        dsap, ssap, control_field, organization_code, type = _HEADER.unpack_from(data)
 
-        # save payload
         # if we know the next proto, parse the payload
-        data = data[8:]
-        payload = None
-        if type == 0x0800:
-            payload = Ipv4.from_raw(data)
-        elif type == 0x0806:
-            payload = Arp.from_raw(data)
-        elif type == 0x888e:
-            payload = Dot1xAuthentication.from_raw(data)
+        payload = data[8:]
+        if (next_proto := _NEXT.get(type)) is not None:
+            payload = next_proto.from_raw(payload)
 
         return cls(dsap, ssap, control_field, organization_code, type, payload)
+    # --- end of generated from_raw ---
 
     @classmethod
     def from_dict(cls, cond):
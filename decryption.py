@@ -0,0 +1,253 @@
+import hashlib
+import hmac
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from struct import Struct
+
+from cryptography.exceptions import InvalidTag
+from cryptography.hazmat.primitives.ciphers import algorithms
+from cryptography.hazmat.primitives.ciphers.aead import AESCCM
+from cryptography.hazmat.primitives.cmac import CMAC
+from cryptography.hazmat.primitives.keywrap import InvalidUnwrap, aes_key_unwrap
+
+
+"""
+Decryption stage for AES-CCMP protected data frames, see Packet.parse in dict_p.
+Pairwise keys are derived from the EAPOL 4-way handshakes seen in the capture: PMKs come from the configured
+(ssid, passphrase) pairs or are given as they are, and the one whose MIC matches message 2 is used. Group keys are
+unwrapped from message 3 and from group key handshakes. Keys are kept per (bssid, station) pair, a frame without a key
+stays TO_DECRYPT. Decrypted frames continue with the protocol dot11_header had for them, usually llc.
+PBKDF2 of passphrases is the only heavy part, with workers it runs in a process pool while the capture is read.
+Frames are decrypted in place, OpenSSL does it faster than they could be sent to another process
+"""
+
+# Pairs whose keys and handshakes are kept, least recently used ones are dropped past it
+KEY_CACHE_SIZE = 4096
+
+_EAPOL_KEY = 3
+# descriptor type, key information, key length, replay counter, nonce, iv, rsc, id, mic, key data length
+_KEY = Struct('!BHH8s32s16s8s8s16sH')
+_MIC_OFFSET = 4 + 77
+_MIC_SIZE = 16
+# Key information bits
+_DESCRIPTOR_VERSION = 7
+_PAIRWISE = 1 << 3
+_INSTALL = 1 << 6
+_ACK = 1 << 7
+_MIC = 1 << 8
+_SECURE = 1 << 9
+_ENCRYPTED_KEY_DATA = 1 << 12
+
+_PTK_LABEL = b'Pairwise key expansion'
+_PTK_SIZE = 48
+_CCMP_MIC_SIZE = 8
+_GTK_KDE = b'\x00\x0f\xac\x01'
+
+
+class Decryptor:
+    # networks are {ssid: passphrase}, pmks are PMKs of networks whose passphrase isn't known.
+    # If workers is set, PMKs of networks are derived by that many processes
+    def __init__(self, networks=None, pmks=(), workers=0, key_cache_size=KEY_CACHE_SIZE):
+        self.key_cache_size = key_cache_size
+        self.pool = ProcessPoolExecutor(workers) if workers and networks else None
+        self.pmks = [bytes(pmk) for pmk in pmks]
+        # Futures or PMKs of networks, resolved when the first handshake needs them
+        self.derived = [self.pool.submit(_pmk, ssid, passphrase) if self.pool else (ssid, passphrase)
+                        for ssid, passphrase in (networks or {}).items()]
+        # (bssid, station) -> [anonce, snonce, message 2, its MIC, descriptor version]
+        self.handshakes = OrderedDict()
+        # (bssid, station) -> (kck, kek, tk, descriptor version)
+        self.ptks = OrderedDict()
+        # (bssid, key id) -> gtk
+        self.gtks = OrderedDict()
+        self.decrypted = 0
+        self.failed = 0
+        self.no_key = 0
+
+    def close(self):
+        if self.pool:
+            self.pool.shutdown()
+            self.pool = None
+
+    def report(self) -> str:
+        return f'{len(self.ptks)} pairwise keys, {len(self.gtks)} group keys, {self.decrypted} frames decrypted, ' \
+               f'{self.failed} failed, {self.no_key} without a key'
+
+    # Called for every dot1x_authentication layer, data[offset:] is the EAPOL frame
+    def eapol(self, pkt, data: memoryview, offset: int):
+        if len(data) - offset < 4 + _KEY.size or data[offset + 1] != _EAPOL_KEY:
+            return
+        end = min(offset + 4 + (data[offset + 2] << 8 | data[offset + 3]), len(data))
+        if (pair := _pair(pkt)) is None or end - offset < 4 + _KEY.size:
+            return
+        _, info, _, _, nonce, _, _, _, mic, key_data_length = _KEY.unpack_from(data, offset + 4)
+        key_data = bytes(data[offset + 4 + _KEY.size:end])[:key_data_length]
+        version = info & _DESCRIPTOR_VERSION
+
+        if not info & _PAIRWISE:
+            # Group key handshake, message 1 carries the new GTK
+            if info & _ACK and info & _ENCRYPTED_KEY_DATA and (ptk := self.ptks.get(pair)):
+                self.unwrap_gtk(pair[0], ptk, key_data)
+            return
+
+        state = self.handshakes.get(pair)
+        if state is None:
+            state = [None, None, None, None, version]
+            self.remember(self.handshakes, pair, state)
+        if info & _ACK:
+            # Message 1 or 3 from the authenticator, both carry the ANonce. A new one starts a new handshake
+            if state[0] != nonce:
+                state[0] = nonce
+                if not info & _MIC:
+                    state[1] = None
+        elif info & _MIC and not info & _SECURE and any(nonce):
+            # Message 2, its MIC tells which PMK the station used
+            message = bytearray(data[offset:end])
+            message[_MIC_OFFSET:_MIC_OFFSET + _MIC_SIZE] = bytes(_MIC_SIZE)
+            state[1:] = nonce, bytes(message), mic, version
+        else:
+            return
+
+        if state[0] is not None and state[1] is not None:
+            # Either way the handshake is done with, a retransmitted message starts it again
+            del self.handshakes[pair]
+            if (ptk := self.derive(pair, *state)) is not None:
+                self.remember(self.ptks, pair, ptk)
+        if info & _ACK and info & _INSTALL and info & _ENCRYPTED_KEY_DATA and (ptk := self.ptks.get(pair)):
+            self.unwrap_gtk(pair[0], ptk, key_data)
+
+    # Returns (kck, kek, tk, version) of the first PMK that gives message 2 its MIC
+    def derive(self, pair: tuple, anonce: bytes, snonce: bytes, message: bytes, mic: bytes, version: int):
+        bssid, station = pair
+        context = min(bssid, station) + max(bssid, station) + min(anonce, snonce) + max(anonce, snonce)
+        for pmk in self.candidates():
+            ptk = _kdf(pmk, context) if version == 3 else _prf(pmk, context)
+            if hmac.compare_digest(_eapol_mic(ptk[:16], message, version), mic):
+                return ptk[:16], ptk[16:32], ptk[32:48], version
+        return None
+
+    def candidates(self) -> list:
+        if self.derived:
+            self.pmks.extend(_pmk(*item) if isinstance(item, tuple) else item.result() for item in self.derived)
+            self.derived = []
+        return self.pmks
+
+    def unwrap_gtk(self, bssid: bytes, ptk: tuple, key_data: bytes):
+        _, kek, _, version = ptk
+        if version == 1 or not key_data or len(key_data) % 8:
+            # WPA1 wraps key data with RC4, there's no CCMP group traffic to read then anyway
+            return
+        try:
+            key_data = aes_key_unwrap(kek, key_data)
+        except InvalidUnwrap:
+            return
+        i = 0
+        while i + 2 <= len(key_data):
+            kind, length = key_data[i], key_data[i + 1]
+            body = key_data[i + 2:i + 2 + length]
+            if kind == 0xdd and body[:4] == _GTK_KDE and len(body) > 6:
+                self.remember(self.gtks, (bssid, body[4] & 3), body[6:])
+            i += 2 + length
+
+    # Called for TO_DECRYPT payloads. Returns (next protocol, plaintext, 0) or the payload if it can't be decrypted
+    def decrypt(self, pkt, payload: tuple) -> tuple:
+        _, data, offset, header, next_proto = payload
+        pair = _pair(pkt)
+        receiver = pkt.fields.get('dot11_header.receiver')
+        if pair is None or receiver is None or len(data) - offset < _CCMP_MIC_SIZE:
+            return payload
+        ccmp = data[offset - 8:offset]
+        if receiver[0] & 1:
+            tk = self.gtks.get((pair[0], ccmp[3] >> 6))
+        else:
+            tk = self.ptks.get(pair)
+            if tk is not None:
+                self.ptks.move_to_end(pair)
+                tk = tk[2]
+        if tk is None:
+            self.no_key += 1
+            return payload
+
+        # The AAD is built only here, for frames there's a key for
+        aad, priority = _aad(data, header, offset - 8)
+        nonce = bytes((priority,)) + bytes(data[header + 10:header + 16]) + \
+            bytes((ccmp[7], ccmp[6], ccmp[5], ccmp[4], ccmp[1], ccmp[0]))
+        try:
+            plaintext = AESCCM(tk, _CCMP_MIC_SIZE).decrypt(nonce, bytes(data[offset:]), aad)
+        except (InvalidTag, ValueError):
+            self.failed += 1
+            return payload
+        self.decrypted += 1
+        return next_proto, memoryview(plaintext), 0
+
+    def remember(self, cache: OrderedDict, key, value):
+        if key in cache:
+            cache.move_to_end(key)
+        elif len(cache) >= self.key_cache_size:
+            cache.popitem(last=False)
+        cache[key] = value
+
+
+# (bssid, station) of a frame between an AP and one of its stations, None for other frames
+def _pair(pkt):
+    bssid = pkt.fields.get('dot11_header.bssid')
+    station = pkt.fields.get('dot11_header.sta_address')
+    if bssid is None:
+        return None
+    # Group addressed frames from the AP have no station, they only need the bssid
+    return bssid, station if station is not None else b''
+
+
+# Returns the AAD and the priority of the protected frame whose header spans data[header:end]
+def _aad(data: memoryview, header: int, end: int) -> (bytes, int):
+    fc0, fc1 = data[header], data[header + 1]
+    qos = fc0 & 0x80
+    # Subtype bits 4-6, retry, power management and more data are masked, so is order in QoS frames
+    aad = bytearray((fc0 & 0x8f, fc1 & (0x47 if qos else 0xc7)))
+    aad += data[header + 4:header + 22]
+    # Only the fragment number of sequence control
+    aad += bytes((data[header + 22] & 0x0f, 0))
+    if fc1 & 3 == 3:
+        aad += data[header + 24:header + 30]
+    priority = 0
+    if qos:
+        priority = data[end - 2] & 0x0f
+        aad += bytes((priority, 0))
+    return bytes(aad), priority
+
+
+def _pmk(ssid, passphrase) -> bytes:
+    ssid = ssid.encode('utf-8') if isinstance(ssid, str) else ssid
+    passphrase = passphrase.encode('utf-8') if isinstance(passphrase, str) else passphrase
+    return hashlib.pbkdf2_hmac('sha1', passphrase, ssid, 4096, 32)
+
+
+# PRF-384 of 802.11i, key descriptor versions 1 and 2
+def _prf(pmk: bytes, context: bytes) -> bytes:
+    r = b''
+    i = 0
+    while len(r) < _PTK_SIZE:
+        r += hmac.new(pmk, _PTK_LABEL + b'\x00' + context + bytes((i,)), hashlib.sha1).digest()
+        i += 1
+    return r[:_PTK_SIZE]
+
+
+# KDF-SHA256-384 of 802.11w, key descriptor version 3
+def _kdf(pmk: bytes, context: bytes) -> bytes:
+    r = b''
+    i = 1
+    while len(r) < _PTK_SIZE:
+        r += hmac.new(pmk, i.to_bytes(2, 'little') + _PTK_LABEL + context + (_PTK_SIZE * 8).to_bytes(2, 'little'),
+                      hashlib.sha256).digest()
+        i += 1
+    return r[:_PTK_SIZE]
+
+
+def _eapol_mic(kck: bytes, message: bytes, version: int) -> bytes:
+    if version == 1:
+        return hmac.new(kck, message, hashlib.md5).digest()
+    if version == 2:
+        return hmac.new(kck, message, hashlib.sha1).digest()[:_MIC_SIZE]
+    c = CMAC(algorithms.AES(kck))
+    c.update(message)
+    return c.finalize()
@@ -2,16 +2,23 @@ import json
 from datetime import datetime
 import timeit
 
-from extensions import Session, Rule, COMPARISONS, ipv4_to_int, mac_to_int, mac_to_bytes
+from extensions import NS_PER_SECOND, Session, Rule, RuleNetwork, ConditionOrder, ipv4_to_int, mac_to_bytes, decode_value
 
 from .network_protocols import *
 from dump_writer import DumpWriter
+from prefilter import Prefilter
 
 fields_values_decoder = {
     'arp.sender_ip': lambda a: ipv4_to_int(a) if a is not None else b'',
-    'arp.sender_mac': lambda a: mac_to_int(a) if a is not None else b'',
+    'arp.sender_mac': lambda a: mac_to_bytes(a) if a is not None else b'',
     'arp.target_ip': lambda a: ipv4_to_int(a) if a is not None else b'',
-    'arp.target_mac': lambda a: mac_to_int(a) if a is not None else b'',
+    'arp.target_mac': lambda a: mac_to_bytes(a) if a is not None else b'',
+    'dot11_header.receiver': lambda a: mac_to_bytes(a) if a is not None else b'',
+    'dot11_header.transmitter': lambda a: mac_to_bytes(a) if a is not None else b'',
+    'dot11_header.destination': lambda a: mac_to_bytes(a) if a is not None else b'',
+    'dot11_header.source': lambda a: mac_to_bytes(a) if a is not None else b'',
+    'dot11_header.bssid': lambda a: mac_to_bytes(a) if a is not None else b'',
+    'dot11_header.sta_address': lambda a: mac_to_bytes(a) if a is not None else b'',
     "dhcp.client_ip": lambda a: ipv4_to_int(a) if a is not None else 0,
     "dhcp.your_ip": lambda a: ipv4_to_int(a) if a is not None else 0,
     "dhcp.server_ip": lambda a: ipv4_to_int(a) if a is not None else 0,
@@ -28,60 +35,181 @@ fields_values_decoder = {
 }
 
 
-def do(path, rules):
+# If lazy is set, parsers decode only fields that rules reference, the rest is decoded when summary needs it.
+# If manager (see RuleManager) is given, it's polled between packets and rules are swapped when its file changes.
+# If adaptive is set, conditions are reordered by their observed selectivity, see ConditionOrder.
+# If queue (see ActionQueue) is given, print actions are written by its worker thread.
+# If profiler (see Profiler) is given, it counts conditions and times parsing, matching and actions. compiled is ignored
+# If prefilter is set, frames that a Prefilter compiled from the rules rejects are skipped without parsing
+# If decryptor (see decryption.Decryptor) is given, protected data frames it has keys for are decrypted and parsed on
+def do(path, rules, compiled=False, debug=False, lazy=False, manager=None, adaptive=False, queue=None, profiler=None,
+       prefilter=False, decryptor=None):
     for rule in rules:
-        for cond in rule.conditions:
-            cond.val = fields_values_decoder.get(cond.pth, lambda a: a)(cond.val)
+        prepare_rule(rule, queue)
+    if manager:
+        manager.bind(lambda rule: prepare_rule(rule, queue))
+    network, match, need = build(rules, compiled, debug, lazy, profiler)
+    accept = build_prefilter(rules, debug, decryptor is not None) if prefilter else None
+    order = ConditionOrder(debug=debug) if adaptive else None
+    parse = profiler.parse(Packet) if profiler else Packet
     s = Session(path)
     start = timeit.default_timer()
     for pkt in s:
-        pkt = Packet(pkt)
-        for rule in rules:
-            rule_matched = True
-            for cond in rule.conditions:
-                obj = True if cond.pth in pkt.protos else pkt.fields.get(cond.pth)
-                if (a := cond.act) in COMPARISONS:
-                    condition_matched = COMPARISONS[a](obj, cond.val)
-                else:
-                    print(f'WARNING: unknown condition in rule {rule.name}: {cond}')
-                    condition_matched = False
-                if not condition_matched:
-                    rule_matched = False
-            if rule_matched:
-                rule.add(pkt)
+        if manager and manager.poll() is not None:
+            network, match, need = build(manager.rules, compiled, debug, lazy, profiler)
+            accept = build_prefilter(manager.rules, debug, decryptor is not None) if prefilter else None
+        if accept and not accept(pkt):
+            continue
+        pkt = parse(pkt, need, decryptor)
+        if order and order.step(network, pkt):
+            network, match, need = build(network.rules, compiled, debug, lazy, profiler)
+        for rule in match(pkt):
+            rule.add(pkt)
     return timeit.default_timer() - start
 
 
+# Converts values of the rule into the form parsers produce. Done once for every rule
+def prepare_rule(rule, queue=None):
+    for cond in rule.conditions:
+        cond.val = decode_value(cond, fields_values_decoder)
+    rule.bind(field_accessor, queue)
+
+
+# Returns network of prepared rules, its matcher and fields that parsers have to decode for it in lazy mode
+def build(rules, compiled=False, debug=False, lazy=False, profiler=None):
+    need = fields_needed([cond.pth for rule in rules for cond in rule.conditions] +
+                         [rule.group_by for rule in rules if rule.group_by]) if lazy else None
+    network = RuleNetwork(rules, field_accessor, lambda pkt: pkt.protos, PROTOS_CONSTRUCTOR)
+    if profiler:
+        return network, profiler.match(network), need
+    return network, (network.compile(field_source, 'pkt.protos', debug) if compiled else network.match), need
+
+
+# Returns None if the rules leave nothing to reject before parsing
+def build_prefilter(rules, debug=False, decrypted=False):
+    accept = Prefilter(rules, decrypted)
+    if debug:
+        print(accept.listing())
+    return None if accept.accepts_all() else accept
+
+
+# Protocol names are stored in Packet.protos, fields in Packet.fields
+def field_accessor(pth):
+    if pth in PROTOS_CONSTRUCTOR:
+        return lambda pkt: True if pth in pkt.protos else None
+    return lambda pkt: pkt.fields.get(pth)
+
+
+# Same as field_accessor, but returns python code for compiled rules
+def field_source(pth):
+    if pth in PROTOS_CONSTRUCTOR:
+        return f'True if {pth!r} in pkt.protos else None'
+    return f'pkt.fields.get({pth!r})'
+
+
+# Turns field paths into {protocol: fields needed from it, including their parent structures}
+def fields_needed(paths):
+    need = {}
+    for pth in paths:
+        proto, _, field = pth.partition('.')
+        fields = need.setdefault(proto, set())
+        while field:
+            fields.add(field)
+            field = field.rpartition('.')[0]
+    return need
+
+
+# Packet of the frame whose fields are decoded only when something asks for them, decrypted is the payload
+# the decryptor returned for it if there was one
+def unparsed(frame, decrypted=None):
+    pkt = Packet.__new__(Packet)
+    pkt.ll_type, pkt.time, pkt.data = frame
+    pkt.fields = {}
+    pkt.protos = []
+    pkt.need = {}
+    pkt.decryptor = None
+    pkt.decrypted = decrypted
+    return pkt
+
+
 class Packet:
-    __slots__ = 'fields', 'protos', 'll_type', 'time', 'data'
+    __slots__ = 'fields', 'protos', 'll_type', 'time', 'data', 'need', 'decryptor', 'decrypted'
 
     def get(self, field, default=None):
+        if self.need is not None and field not in self.fields:
+            self.decode_all()
         return self.fields.get(field, default)
 
+    # Decodes the fields that were skipped because no rule needed them. The decryptor has already seen the frame,
+    # so it's left out of the re-parse and the payload it decrypted is reused
+    def decode_all(self):
+        if self.need is not None:
+            self.need = None
+            self.fields = {}
+            self.protos = []
+            self.decryptor = None
+            self.parse()
+
     def get_time(self):
-        return datetime.fromtimestamp(float(self.time))
+        return datetime.fromtimestamp(self.time / NS_PER_SECOND)
 
     def summary(self) -> str:
+        self.decode_all()
         words = [f"[{self.get_time()}]", ]
         for proto in self.protos:
             if word := PROTOS_SUMMARY[proto](self.fields):
                 words.append(word)
         return " | ".join(words)
 
-    def __init__(self, pkt):
+    # Copy of the packet that the ActionQueue worker renders while the loop goes on with this one. Fields of a fully
+    # decoded packet are copied, a lazy one is copied as its frame and decoded by the worker when summary needs it
+    def freeze(self):
+        if self.need is not None:
+            return unparsed((self.ll_type, self.time, self.data), self.decrypted)
+        pkt = Packet.__new__(Packet)
+        pkt.ll_type, pkt.time, pkt.data = self.ll_type, self.time, self.data
+        pkt.fields = dict(self.fields)
+        pkt.protos = list(self.protos)
+        pkt.need = None
+        pkt.decryptor = None
+        pkt.decrypted = self.decrypted
+        return pkt
+
+    # need is {protocol: fields} from fields_needed, None means every field is decoded
+    # decryptor (see decryption.Decryptor) is handed EAPOL frames and TO_DECRYPT payloads
+    def __init__(self, pkt, need=None, decryptor=None):
         self.time = None
         self.fields = {}
         self.protos = []
+        self.need = need
+        self.decryptor = decryptor
+        # What the decryptor returned for the TO_DECRYPT payload
+        self.decrypted = None
         self.ll_type, self.time, self.data = pkt
-        payload = (LL_TYPES[self.ll_type], self.data)
+        self.parse()
 
-        while payload:
-            proto, data, *extra = payload
-            temp, payload, *extra = PROTOS_CONSTRUCTOR[proto](data, *extra)
+    def parse(self):
+        # Parsers share one view of the frame and pass offsets instead of slicing it
+        payload = (LL_TYPES[self.ll_type], memoryview(self.data), 0)
+        need = self.need
 
-            if payload[0] in ('MALFORMED','TO_DECRYPT','UNKNOWN'):
-                payload = None
+        while payload:
+            proto, data, offset, *extra = payload
+            temp, payload = PROTOS_CONSTRUCTOR[proto](data, offset, *extra,
+                                                      need=None if need is None else need.get(proto, ()))
 
             for k, v in temp:
                 self.fields[f"{proto}.{k}"] = v
             self.protos.append(proto)
+
+            # The decryptor reads addresses of the frame, so it goes after the fields are stored
+            if payload[0] == 'TO_DECRYPT' and self.decrypted is not None:
+                payload = self.decrypted
+            elif self.decryptor is not None:
+                if payload[0] == 'TO_DECRYPT':
+                    payload = self.decrypted = self.decryptor.decrypt(self, payload)
+                elif proto == 'dot1x_authentication':
+                    self.decryptor.eapol(self, data, offset)
+
+            if payload[0] in ('MALFORMED','TO_DECRYPT','UNKNOWN'):
+                payload = None
@@ -1,21 +1,27 @@
-from struct import unpack
+from struct import Struct
 from extensions import int_to_ipv4
 
+# --- generated from pcc_in.json: parser ---
+_HEADER = Struct('!HHBBH6sI6sI')
 
-def arp(data: bytes) -> (list, tuple):
-    if len(data) < 28:
-        return [], ('MALFORMED', f"ARP requires at least 28 bytes, got {len(data)}")
 
-    t = unpack('!HHBBH6sI6sI', data[:28])
-    return [('hardware_type', t[0]),
-            ('protocol_type', t[1]),
-            ('hardware_size', t[2]),
-            ('protocol_size', t[3]),
-            ('opcode',t[4]),
-            ('sender_mac', t[5]),
-            ('sender_ip', t[6]),
-            ('target_mac', t[7]),
-            ('target_ip',t[8])], ('UNKNOWN', data[28:])
+def arp(data: memoryview, offset: int = 0, need=None) -> (list, tuple):
+    if len(data) - offset < 28:
+        return [], ('MALFORMED', f"ARP requires at least 28 bytes, got {len(data) - offset}")
+
+    t = _HEADER.unpack_from(data, offset)
+    r = [('hardware_type', t[0]),
+         ('protocol_type', t[1]),
+         ('hardware_size', t[2]),
+         ('protocol_size', t[3]),
+         ('opcode', t[4]),
+         ('sender_mac', t[5]),
+         ('sender_ip', t[6]),
+         ('target_mac', t[7]),
+         ('target_ip', t[8])]
+
+    return r, ('UNKNOWN', data, offset + 28)
+# --- end of generated parser ---
 
 
 def summary(par: dict):
@@ -1,12 +1,18 @@
-from struct import unpack
-from extensions import flatten_tuple
+from struct import Struct
+from extensions import flatten_tuple, read_bytes
 
+_HEADER = Struct('!BBBBIH2sIIII6s')
+_CLIENT_IDENTIFIER = Struct('!B6s')
+_CFQDN = Struct('!sBB')
+_COOKIE = Struct('4s')
+_MAGIC_COOKIE = b'\x63\x82\x53\x63'
 
-def dhcp(data: bytes) -> (list, tuple):
-    if len(data) < 236:
-        return [], ('MALFORMED', f"DHCP requires at least 236 bytes, got {len(data)}")
 
-    t = unpack('!BBBBIH2sIIII6s10s64s128s', data[:236])
+def dhcp(data: memoryview, offset: int = 0, need=None) -> (list, tuple):
+    if len(data) - offset < 236:
+        return [], ('MALFORMED', f"DHCP requires at least 236 bytes, got {len(data) - offset}")
+
+    t = _HEADER.unpack_from(data, offset)
     r = [('opcode', t[0]),
          ('hardware_type', t[1]),
          ('hardware_length', t[2]),
@@ -17,20 +23,26 @@ def dhcp(data: bytes) -> (list, tuple):
          ('your_ip', t[8]),
          ('server_ip', t[9]),
          ('gateway_ip', t[10]),
-         ('client_mac', t[11]),
-         ('client_padding', t[12]),
-         ('server_host_name', t[13]),
-         ('boot_file', t[14])]
-    r = flatten_tuple(r, _flags(t[6]), 'flags')
+         ('client_mac', t[11])]
+    # Long and rarely used fields are decoded only when needed
+    if need is None or 'client_padding' in need:
+        r.append(('client_padding', bytes(data[offset + 34:offset + 44])))
+    if need is None or 'server_host_name' in need:
+        r.append(('server_host_name', bytes(data[offset + 44:offset + 108])))
+    if need is None or 'boot_file' in need:
+        r.append(('boot_file', bytes(data[offset + 108:offset + 236])))
+    if need is None or 'flags' in need:
+        r = flatten_tuple(r, _flags(t[6]), 'flags')
 
-    data = data[236:]
+    offset += 236
 
-    if data:
-        r.append(('magic_cookie', magic_cookie := unpack('!4s', data[:4])[0]))
-        if magic_cookie == b'\x63\x82\x53\x63':  # Magic number identifies that DHCP (not BOOTP) options follow
-            r = flatten_tuple(r, _options(data[4:]), 'options')
+    if offset < len(data):
+        r.append(('magic_cookie', magic_cookie := _COOKIE.unpack_from(data, offset)[0]))
+        if magic_cookie == _MAGIC_COOKIE and (need is None or 'options' in need):
+            # Magic number identifies that DHCP (not BOOTP) options follow
+            r = flatten_tuple(r, _options(data, offset + 4), 'options')
 
-    return r, ('UNKNOWN', b'')
+    return r, ('UNKNOWN', data, len(data))
 
 
 def summary(par: dict):
@@ -50,17 +62,18 @@ def _flags(data: bytes) -> list:
             ('reserved', (data[0] & 127) << 8 | data[1])]
 
 
-def _options(data: bytes) -> list:
+def _options(data: memoryview, offset: int) -> list:
     r = []
     dns_count = 0
-    while data:
-        option = unpack('!B', data[:1])[0]
+    end = len(data)
+    while offset < end:
+        option = data[offset]
 
         if option == 255:
             break
         else:
-            length = unpack('!B', data[1:2])[0]
-            option_body = unpack(f'!{length}s', data[2:length + 2])[0]
+            length = data[offset + 1]
+            option_body = read_bytes(data, offset + 2, length)
             if option == 1:
                 r.append(('subnet_mask', int.from_bytes(option_body, 'big')))
             elif option == 3:
@@ -96,7 +109,7 @@ def _options(data: bytes) -> list:
                 r = flatten_tuple(r, _client_identifier(option_body), 'client_identifier')
             elif option == 81:
                 r = flatten_tuple(r, _client_fully_qualified_domain_name(option_body), 'client_fully_qualified_domain_name')
-            data = data[length + 2:]
+            offset += length + 2
     return r
 
 
@@ -105,13 +118,13 @@ def _request_list(data: bytes) -> list:
 
 
 def _client_identifier(data: bytes) -> list:
-    t = unpack('!B6s', data[:7])
+    t = _CLIENT_IDENTIFIER.unpack_from(data)
     return [('hardware_type', t[0]),
             ('client_mac_address', t[1])]
 
 
 def _client_fully_qualified_domain_name(data: bytes) -> list:
-    t = unpack('!sBB', data[:3])
+    t = _CFQDN.unpack_from(data)
     return flatten_tuple([('a_rr_result', t[1]),
                           ('ptr_rr_result', t[2]),
                           ('client_name', data[3:])],
@@ -1,14 +1,22 @@
-from struct import unpack
+from struct import Struct
 from extensions import get_bytes_to_mac, flatten_tuple
 
+_HEADER = Struct('!2sH6s')
+_ADDRESSES = Struct('!6s6sH')
+_MAC = Struct('6s')
+_QOS_CONTROL = Struct('2s')
+_CCMP = Struct('8s')
 
-def dot11_header(data: bytes) -> (list, tuple):
-    if len(data) < 10:
-        return [], ('MALFORMED', f"dot11_header requires at least 10 bytes, got {len(data)}")
 
-    t = unpack('!2sH6s', data[:10])
+def dot11_header(data: memoryview, offset: int = 0, need=None) -> (list, tuple):
+    if len(data) - offset < 10:
+        return [], ('MALFORMED', f"dot11_header requires at least 10 bytes, got {len(data) - offset}")
+
+    t = _HEADER.unpack_from(data, offset)
     frame_control, type_subtype, ds, fc_protected = _frame_control(t[0])
-    r = flatten_tuple([('frame_control', t[0])], frame_control, 'frame_control')
+    r = [('frame_control', t[0])]
+    if need is None or 'frame_control' in need:
+        r = flatten_tuple(r, frame_control, 'frame_control')
 
     r.extend([('type_subtype', type_subtype),
               ('ds', ds),
@@ -19,24 +27,24 @@ def dot11_header(data: bytes) -> (list, tuple):
     source = None
 
     if type_subtype in (28, 29, 30):  # type=1 & subtype=(12|13|14)
-        last = 10
+        last = offset + 10
     elif type_subtype in (24, 26, 27):  # type=1 & subtype=(8|10|11)
-        transmitter = unpack('!6s', data[10:16])[0]
-        last = 16
+        transmitter = _MAC.unpack_from(data, offset + 10)[0]
+        last = offset + 16
     else:
         # TODO: remove exception when we account for all frame types
         try:
-            transmitter, destination, seq = unpack('!6s6sH', data[10:24])
+            transmitter, destination, seq = _ADDRESSES.unpack_from(data, offset + 10)
             r.append(('sequence_number', seq >> 4))
             r.append(('fragment_number', seq & 15))
         except Exception:
             print(f'Exception in dot11_header.py: type_subtype: {hex(type_subtype)}')
 
         if ds == 3:
-            source = unpack('!6s', data[24:30])[0]
-            last = 30
+            source = _MAC.unpack_from(data, offset + 24)[0]
+            last = offset + 30
         else:
-            last = 24
+            last = offset + 24
 
     r.append(('receiver', receiver))
     r.append(('transmitter', transmitter))
@@ -61,24 +69,26 @@ def dot11_header(data: bytes) -> (list, tuple):
         r.append(('bssid', None))
         r.append(('sta_address', None))
 
-    payload = ('UNKNOWN', data[last:])
+    payload = ('UNKNOWN', data, last)
     if type_subtype >> 4 == 0:  # type=0
-        payload = ('dot11_management', data[last:], type_subtype & 0b1111)
+        payload = ('dot11_management', data, last, type_subtype & 0b1111)
     elif type_subtype in (32, 40):  # type=2 & subtype=(0|8)
         if type_subtype == 40:  # type=2 & subtype=8
-            t, payload_type = _qos_control(unpack('!2s', data[last:last + 2])[0])
-            r = flatten_tuple(r, t, 'qos_control')
+            t, payload_type = _qos_control(_QOS_CONTROL.unpack_from(data, last)[0])
+            if need is None or 'qos_control' in need:
+                r = flatten_tuple(r, t, 'qos_control')
             last += 2
             if payload_type == 0:
-                payload = ('llc', data[last:])
+                payload = ('llc', data, last)
         else:
-            payload = ('llc', data[last:])
+            payload = ('llc', data, last)
         if fc_protected:
-            r = flatten_tuple(r, _ccmp(unpack('<8s', data[last:last + 8])[0]), 'ccmp')
+            if need is None or 'ccmp' in need:
+                r = flatten_tuple(r, _ccmp(_CCMP.unpack_from(data, last)[0]), 'ccmp')
             last += 8
-            t = list(data[:last])
-            t[1] = t[1] & 0b10111111
-            payload = ('TO_DECRYPT', data[last:], bytes(t[:-8]))
+            # The decryption stage builds the AAD from the header at offset, and only for frames it has a key for.
+            # After decryption the frame goes on with the protocol it would have had unprotected
+            payload = ('TO_DECRYPT', data, last, offset, payload[0])
 
     return r, payload
 
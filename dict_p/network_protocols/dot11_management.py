@@ -1,10 +1,105 @@
-from struct import unpack, error
+from collections import OrderedDict
+from threading import Lock
+from struct import Struct
 from extensions import flatten_tuple
 
+_ASSOCIATION_REQUEST = Struct('<2sH')
+_ASSOCIATION_RESPONSE = Struct('<2sHH')
+_BEACON = Struct('<QH2s')
+_REASON_CODE = Struct('<H')
+_AUTHENTICATION = Struct('<HHH')
+_BLOCK_ACK = Struct('<BHHH')
+_DELBA = Struct('<HH')
+_MEASUREMENT_REQUEST = Struct('<BH')
+_ACTION = Struct('<BB')
+_MAC = Struct('6s')
+# oui, type
+_VENDOR = Struct('>HBB')
 
-def dot11_management(data: bytes, subtype: int) -> (list, tuple):
-    t, data = _fixed(data, subtype)
-    return flatten_tuple(flatten_tuple([], t, 'fixed'), _tagged(data), 'tagged'), ('UNKNOWN', b'')
+# Tag number -> reported field. Values of other tags are never copied out of the frame
+TAGS = {0: 'ssid',
+        1: 'supported_rates',
+        5: 'traffic_indication_map',
+        7: 'country_information',
+        32: 'power_constraint',
+        35: 'tpc_report_transmit_power',
+        45: 'ht_capabilities',
+        48: 'rsn_information',
+        61: 'ht_information',
+        127: 'extended_capabilities',
+        191: 'vht_capabilities',
+        192: 'vht_operation',
+        221: 'vendor_specific'}
+_PATHS = {tag_number: f'tagged.{name}' for tag_number, name in TAGS.items()}
+_VENDOR_SPECIFIC = 221
+_TIM = 5
+_TIM_PATH = _PATHS[_TIM]
+
+# Probe responses and beacons, an AP sends the same tagged parameters in them over and over
+_CACHED_SUBTYPES = (5, 8)
+IE_CACHE_SIZE = 1024
+
+
+"""
+LRU cache of decoded tagged parameters, keyed by the bytes of the elements themselves, so a hit is never wrong.
+Beacons differ in the TIM only, so for them the key leaves the first TIM out and its value is read from every frame.
+The transmitter isn't part of the key: the content alone decides the result, and APs of one network can share entries
+"""
+class IECache:
+    __slots__ = 'size', 'entries', 'hits', 'misses', 'evictions', 'lock'
+
+    def __init__(self, size=IE_CACHE_SIZE):
+        self.size = size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # The ActionQueue worker decodes frozen lazy packets while the packet loop parses others
+        self.lock = Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry):
+        with self.lock:
+            if len(self.entries) >= self.size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+            self.entries[key] = entry
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def report(self) -> str:
+        return f'{len(self.entries)} entries, {self.hits} hits, {self.misses} misses, {self.evictions} evictions'
+
+
+# Set its size to 0 to decode every frame
+IE_CACHE = IECache()
+
+
+def dot11_management(data: memoryview, offset: int, subtype: int, need=None) -> (list, tuple):
+    r = []
+    if need is None or 'fixed' in need:
+        t, offset = _fixed(data, offset, subtype, need)
+        r = flatten_tuple(r, t, 'fixed')
+    else:
+        offset += _fixed_length(data, offset, subtype)
+    if need is None or 'tagged' in need:
+        if subtype in _CACHED_SUBTYPES and IE_CACHE.size > 0:
+            r.extend(_cached_tagged(data, offset, subtype, need))
+        else:
+            r.extend(_tagged(data, offset, need))
+    return r, ('UNKNOWN', data, len(data))
 
 
 def summary(par: dict):
@@ -22,45 +117,56 @@ def summary(par: dict):
     return ret
 
 
-def _fixed(_data: bytes, _subtype: int) -> (list, bytes):
+def _fixed(_data: memoryview, _offset: int, _subtype: int, need=None) -> (list, int):
+    capabilities = need is None or 'fixed.capabilities' in need
     if _subtype in (0, 2):  # association request, reassociation request
-        t = unpack('<2sH', _data[:4])
+        t = _ASSOCIATION_REQUEST.unpack_from(_data, _offset)
         r = [('listen_interval', t[1])]
-        r = flatten_tuple(r, _capabilities(t[0]), 'capabilities')
+        if capabilities:
+            r = flatten_tuple(r, _capabilities(t[0]), 'capabilities')
         last = 4
         if _subtype == 2:
-            r.append(('current_ap', unpack('6s', _data[4:10])))
+            r.append(('current_ap', _MAC.unpack_from(_data, _offset + 4)))
             last = 10
     elif _subtype in (1, 3):  # association response, reassociation response
-        t = unpack('<2sHH', _data[:6])
+        t = _ASSOCIATION_RESPONSE.unpack_from(_data, _offset)
         r = [('status_code', t[1]),
              ('status_code', t[2] & 16383)]
-        r = flatten_tuple(r, _capabilities(t[0]), 'capabilities')
+        if capabilities:
+            r = flatten_tuple(r, _capabilities(t[0]), 'capabilities')
         last = 6
     elif _subtype in (5, 8):  # probe response, beacon
-        t = unpack('<QH2s', _data[:12])
+        t = _BEACON.unpack_from(_data, _offset)
         r = [('timestamp', t[0]),
              ('beacon_interval', t[1])]
-        r = flatten_tuple(r, _capabilities(t[2]), 'capabilities')
+        if capabilities:
+            r = flatten_tuple(r, _capabilities(t[2]), 'capabilities')
         last = 12
     elif _subtype in (10, 12):  # disassociation, deauthentication
-        r = [('reason_code', unpack('<H', _data[:2])[0])]
+        r = [('reason_code', _REASON_CODE.unpack_from(_data, _offset)[0])]
         last = 2
     elif _subtype == 11:  # authentication
-        t = unpack('<HHH', _data[:6])
+        t = _AUTHENTICATION.unpack_from(_data, _offset)
         r = [('authentication_algorithm', t[0]),
              ('authentication_seq', t[1]),
              ('status_code', t[2])]
         last = 6
     elif _subtype == 13:
-        t, _data = _action(_data)
+        t, _offset = _action(_data, _offset)
         r = flatten_tuple([], t, 'action')
         last = 0
     else:
         last = 0
         r = []
 
-    return r, _data[last:]
+    return r, _offset + last
+
+
+# Returns length of the fixed parameters without decoding them. Used when no fixed field is needed
+def _fixed_length(_data: memoryview, _offset: int, _subtype: int) -> int:
+    if _subtype == 13:
+        return _action(_data, _offset)[1] - _offset
+    return {0: 4, 1: 6, 2: 10, 3: 6, 5: 12, 8: 12, 10: 2, 11: 6, 12: 2}.get(_subtype, 0)
 
 
 def _capabilities(_data: bytes) -> list:
@@ -80,100 +186,130 @@ def _capabilities(_data: bytes) -> list:
             ('immediate_block_ack', (_data[1] >> 7) & 1)]
 
 
-def _action(_data: bytes) -> (list, bytes):
-    category_code, action_code = unpack('<BB', _data[:2])
+def _action(_data: memoryview, _offset: int) -> (list, int):
+    category_code, action_code = _ACTION.unpack_from(_data, _offset)
     r = [('category_code', category_code),
          ('action_code', action_code)]
-    _data = _data[2:]
+    _offset += 2
     if category_code == 3:
         if action_code == 0:
-            t = unpack('<BHHH', _data[:7])
+            t = _BLOCK_ACK.unpack_from(_data, _offset)
             r.extend([('dialog_token', t[0]),
                       ('block_ack_parameters', t[1]),
                       ('block_ack_timeout', t[2]),
                       ('block_ack_ssc', t[3])])
-            _data = _data[7:]
+            _offset += 7
         elif action_code == 1:
-            t = unpack('<BHHH', _data[:7])
+            t = _BLOCK_ACK.unpack_from(_data, _offset)
             r.extend([('dialog_token', t[0]),
                       ('status_code', t[1]),
                       ('block_ack_parameters', t[2]),
                       ('block_ack_timeout', t[3])])
-            _data = _data[7:]
+            _offset += 7
         elif action_code == 2:
-            t = unpack('<HH', _data[:4])
+            t = _DELBA.unpack_from(_data, _offset)
             r.extend([('delete_block_ack', t[0]),
                       ('reason_code', t[1])])
-            _data = _data[4:]
+            _offset += 4
         else:
             r = []
-            _data = b''
+            _offset = len(_data)
     elif category_code == 5:
         if action_code == 0:
-            t = unpack('<BH', _data[:3])
+            t = _MEASUREMENT_REQUEST.unpack_from(_data, _offset)
             r.extend([('dialog_token', t[0]),
                       ('repetitions', t[1])])
-            _data = _data[3:]
+            _offset += 3
         elif action_code == 4:
-            r.append(('dialog_token', unpack('<B', _data[:1])[0]))
-            _data = _data[1:]
+            r.append(('dialog_token', _data[_offset]))
+            _offset += 1
         else:
             r = []
-            _data = b''
+            _offset = len(_data)
     else:
         r = []
-        _data = b''
+        _offset = len(_data)
+
+    return r, _offset
+
 
-    return r, _data
+# Returns {tag number: (offset, length)} of the elements from offset to the end of the frame, a repeated tag is
+# indexed by its last occurrence. Also returns offsets of the vendor specific elements that hold an oui and type.
+# An element that runs past the end of the frame is cut there, a single byte left after the last one is ignored
+def ie_index(data: memoryview, offset: int = 0) -> (dict, list):
+    index = {}
+    vendors = []
+    end = len(data)
+    while offset + 2 <= end:
+        tag_number = data[offset]
+        offset += 2
+        if offset + (tag_length := data[offset - 1]) > end:
+            tag_length = end - offset
+        index[tag_number] = (offset, tag_length)
+        if tag_number == _VENDOR_SPECIFIC and tag_length >= 4:
+            vendors.append(offset)
+        offset += tag_length
+    return index, vendors
 
 
-def _tagged(data: bytes) -> list:
+# Only the values of indexed tags that are needed are copied. Returned names are already prefixed with 'tagged.'
+def _tagged(data: memoryview, offset: int = 0, need=None) -> list:
     r = []
-    tags = {}
-    while data:
-        try:
-            tag_number, tag_length = unpack('!BB', data[:2])
-            try:
-                tag_value = unpack(f'!{tag_length}s', data[2:tag_length + 2])[0]
-            except error as e:
-                # return extensions.MalformedPacketException(f"Is packet malformed? Couldn't unpack: {e}")
-                tag_value = unpack(f'!{len(data)}s', data)[0]
-        except:
-            tag_number = 256
-            tag_length = 256
-            tag_value = unpack(f'!{len(data)}s', data)[0]
-        tags[tag_number] = (tag_length, tag_value)
-        # TODO: account for vendor-specific
-        data = data[tag_length + 2:]
-    
-    if 0 in tags:
-        if tags[0][1]:
-            r.append(('ssid', tags[0][1]))  # If we have a name
-        else:
-            r.append(('ssid', b'Wildcard (Broadcast)'))
-    if 1 in tags:
-        r.append(('supported_rates', tags[1][1]))
-    if 5 in tags:
-        r.append(('traffic_indication_map', tags[5][1]))
-    if 7 in tags:
-        r.append(('country_information', tags[7][1]))
-    if 32 in tags:
-        r.append(('power_constraint', tags[32][1]))
-    if 35 in tags:
-        r.append(('tpc_report_transmit_power', tags[35][1]))
-    if 45 in tags:
-        r.append(('ht_capabilities', tags[45][1]))
-    if 48 in tags:
-        r.append(('rsn_information', tags[48][1]))
-    if 61 in tags:
-        r.append(('ht_information', tags[61][1]))
-    if 127 in tags:
-        r.append(('extended_capabilities', tags[127][1]))
-    if 191 in tags:
-        r.append(('vht_capabilities', tags[191][1]))
-    if 192 in tags:
-        r.append(('vht_operation', tags[192][1]))
-    if 221 in tags:
-        r.append(('vendor_specific', tags[221][1]))
+    index, vendors = ie_index(data, offset)
+    for tag_number, path in _PATHS.items():
+        if tag_number in index and (need is None or path in need):
+            start, length = index[tag_number]
+            if length or tag_number:
+                r.append((path, bytes(data[start:start + length])))
+            else:
+                r.append((path, b'Wildcard (Broadcast)'))  # Hidden ssid
+    if vendors and (need is None or 'tagged.vendors' in need):
+        r.append(('tagged.vendors', tuple(_vendor(data, start) for start in vendors)))
+    return r
+
 
+# Same as _tagged, but the elements are decoded only when IE_CACHE has no entry for them.
+# Entries hold every field and the fields of the last need they were filtered by, which stays the same during a run
+def _cached_tagged(data: memoryview, offset: int, subtype: int, need=None) -> list:
+    tim = _find_tim(data, offset) if subtype == 8 else None
+    if tim is None:
+        key = bytes(data[offset:])
+    else:
+        key = bytes(data[offset:tim[0]]), bytes(data[tim[1]:])
+
+    if (entry := IE_CACHE.get(key)) is None:
+        r = _tagged(data, offset)
+        # The first TIM is what gets reported unless another one follows it, and only that one is left out of the key
+        position = None
+        if tim is not None and _find_tim(data, tim[1]) is None:
+            position = next(i for i, (path, _) in enumerate(r) if path == _TIM_PATH)
+        # [fields, position of the TIM in them, need, fields for the need, position of the TIM in those]
+        entry = [r, position, None, r, position]
+        IE_CACHE.put(key, entry)
+
+    if need is not None and entry[2] is not need:
+        kept = [i for i, (path, _) in enumerate(entry[0]) if path in need]
+        entry[2:] = need, [entry[0][i] for i in kept], kept.index(entry[1]) if entry[1] in kept else None
+    r, position = (entry[0], entry[1]) if need is None else (entry[3], entry[4])
+    r = list(r)
+    if position is not None:
+        r[position] = (_TIM_PATH, bytes(data[tim[0] + 2:tim[1]]))
     return r
+
+
+# Returns (start, end) of the first TIM element, its header included, or None if there's none.
+# An element that runs past the frame ends with it, same as in ie_index
+def _find_tim(data: memoryview, offset: int):
+    end = len(data)
+    while offset + 2 <= end:
+        stop = min(offset + 2 + data[offset + 1], end)
+        if data[offset] == _TIM:
+            return offset, stop
+        offset = stop
+    return None
+
+
+# Returns (oui, type) of the vendor specific element whose value starts at offset
+def _vendor(data: memoryview, offset: int) -> tuple:
+    t = _VENDOR.unpack_from(data, offset)
+    return t[0] << 8 | t[1], t[2]
@@ -1,22 +1,27 @@
-from struct import unpack
-from extensions import flatten_tuple
+from struct import Struct
+from extensions import flatten_tuple, read_bytes
 
+_HEADER = Struct('!BBH')
+_KEY = Struct('!B2sHQ32s16s8s8s16sH')
 
-def dot1x_authentication(data: bytes) -> (list, tuple):
-    if len(data) < 4:
-        return [], ('MALFORMED', f"1x_auth requires at least 4 bytes, got {len(data)}")
 
-    t = unpack('!BBH', data[:4])
+def dot1x_authentication(data: memoryview, offset: int = 0, need=None) -> (list, tuple):
+    if len(data) - offset < 4:
+        return [], ('MALFORMED', f"1x_auth requires at least 4 bytes, got {len(data) - offset}")
+
+    t = _HEADER.unpack_from(data, offset)
     r = [('version', t[0]),
          ('type', _type := t[1]),
          ('length', length := t[2])]
 
-    data = data[4:length + 4]
+    # Bounds the body to the declared length without copying it
+    data = data[:offset + length + 4]
+    offset += 4
 
     if _type == 0:  # EAP packet
-        return r, ('eap', data)
+        return r, ('eap', data, offset)
     elif _type == 3:  # key
-        t = unpack('!B2sHQ32s16s8s8s16sH', data[:95])
+        t = _KEY.unpack_from(data, offset)
         r.extend([('key_descriptor_type', t[0]),
                   ('key_length', t[2]),
                   ('replay_counter', t[3]),
@@ -26,13 +31,14 @@ def dot1x_authentication(data: bytes) -> (list, tuple):
                   ('wpa_key_id', t[7]),
                   ('wpa_key_mic', t[8]),
                   ('wpa_key_data_length', wpa_key_data_length := t[9])])
-        r = flatten_tuple(r, _key_information(t[1]), 'key_information')
-        if wpa_key_data_length:
-            r.append(('wpa_key_data', unpack(f'!{wpa_key_data_length}s', data[95:95+wpa_key_data_length])))
-        return r, ('UNKNOWN', data[95+wpa_key_data_length:])
+        if need is None or 'key_information' in need:
+            r = flatten_tuple(r, _key_information(t[1]), 'key_information')
+        if wpa_key_data_length and (need is None or 'wpa_key_data' in need):
+            r.append(('wpa_key_data', (read_bytes(data, offset + _KEY.size, wpa_key_data_length),)))
+        return r, ('UNKNOWN', data, offset + _KEY.size + wpa_key_data_length)
     else:
         print(f"WARNING: got 1x packet with unknown yet type: {_type}")
-        return r, ('UNKNOWN', data)
+        return r, ('UNKNOWN', data, offset)
 
 
 def summary(par: dict):
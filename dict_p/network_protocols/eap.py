@@ -1,31 +1,35 @@
-from struct import unpack
-from extensions import flatten_tuple
+from struct import Struct
+from extensions import flatten_tuple, read_bytes
 
+_HEADER = Struct('!BBH')
+_TLS_LENGTH = Struct('!I')
 
-def eap(data: bytes) -> (list, tuple):
-    if len(data) < 4:
-        return [], ('MALFORMED', f"EAP requires at least 4 bytes, got {len(data)}")
 
-    t = unpack('!BBH', data[:4])
+def eap(data: memoryview, offset: int = 0, need=None) -> (list, tuple):
+    if len(data) - offset < 4:
+        return [], ('MALFORMED', f"EAP requires at least 4 bytes, got {len(data) - offset}")
+
+    t = _HEADER.unpack_from(data, offset)
     r = [('code', t[0]),
          ('id', t[1]),
          ('length', length := t[2])]
-    data = data[4:]
+    offset += 4
     if length > 4:
-        r.append(('type', _type := unpack('!B', data[:1])[0]))
+        r.append(('type', _type := data[offset]))
         if _type == 1:
-            r.append(('identity', unpack(f'!{length - 5}s', data[1:length])[0]))
-            data = data[length:]
+            r.append(('identity', read_bytes(data, offset + 1, length - 5)))
+            offset += length
         elif _type == 25:
-            t, length_included = _tls_flags(data[1:2])
-            r = flatten_tuple(r, t, 'tls_flags')
+            t, length_included = _tls_flags(data[offset + 1])
+            if need is None or 'tls_flags' in need:
+                r = flatten_tuple(r, t, 'tls_flags')
             if length_included:
-                r.append(('tls_length', unpack('!I', data[2:6])[0]))
-                data = data[6:]
+                r.append(('tls_length', _TLS_LENGTH.unpack_from(data, offset + 2)[0]))
+                offset += 6
             else:
-                data = data[1:]
+                offset += 1
 
-    return r, ('UNKNOWN', data)
+    return r, ('UNKNOWN', data, offset)
 
 
 def summary(par: dict):
@@ -47,8 +51,8 @@ def summary(par: dict):
     return False
 
 
-def _tls_flags(data: bytes) -> (list, int):
-    return [('length_included', length_included := data[0] >> 7),
-            ('more_fragments', (data[0] >> 6) & 1),
-            ('start', (data[0] >> 5) & 1),
-            ('version', data[0] & 7)], length_included
+def _tls_flags(data: int) -> (list, int):
+    return [('length_included', length_included := data >> 7),
+            ('more_fragments', (data >> 6) & 1),
+            ('start', (data >> 5) & 1),
+            ('version', data & 7)], length_included
@@ -1,19 +1,22 @@
-from struct import unpack
+from struct import Struct
 from extensions import get_bytes_to_mac
 
-from .__constants import ETHER_TYPES
+# --- generated from pcc_in.json: parser ---
+_HEADER = Struct('!6s6sH')
+_NEXT = {0x0800: 'ipv4', 0x0806: 'arp', 0x888e: 'dot1x_authentication'}
 
 
-def ethernet(data: bytes) -> (list, tuple):
-    if len(data) < 14:
-        return [], ('MALFORMED', f"Ethernet requires at least 14 bytes, got {len(data)}")
+def ethernet(data: memoryview, offset: int = 0, need=None) -> (list, tuple):
+    if len(data) - offset < 14:
+        return [], ('MALFORMED', f"Ethernet requires at least 14 bytes, got {len(data) - offset}")
 
-    t = unpack('!6s6sH', data[:14])
+    t = _HEADER.unpack_from(data, offset)
     r = [('destination', t[0]),
-         ('source', t[2]),
-         ('length', length := t[3])]
+         ('source', t[1]),
+         ('length', length := t[2])]
 
-    return r, (ETHER_TYPES.get(length, 'UNKNOWN'), data[14:])
+    return r, (_NEXT.get(length, 'UNKNOWN'), data, offset + 14)
+# --- end of generated parser ---
 
 
 def summary(par: dict):
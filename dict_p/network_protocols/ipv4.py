@@ -1,40 +1,41 @@
-from struct import unpack, error
+from struct import Struct
 from extensions import int_to_ipv4
 
-from .__constants import IP_PROTOS
+# --- generated from pcc_in.json: parser ---
+_HEADER = Struct('!BBHHHBBHII')
+_NEXT = {17: 'udp'}
 
 
-def ipv4(data: bytes) -> (list, tuple):
-    if len(data) < 20:
-        return [], ('MALFORMED', f'IPv4 requires at least 20 bytes, got {len(data)}')
+def ipv4(data: memoryview, offset: int = 0, need=None) -> (list, tuple):
+    if len(data) - offset < 20:
+        return [], ('MALFORMED', f"IPv4 requires at least 20 bytes, got {len(data) - offset}")
 
-    t = unpack('!2sHHBBBBH4s4s', data[:20])
-
-    r = [('version', t[0][0] >> 4),
-         ('ihl', ihl := t[0][0] & 15),
-         ('dscp', t[0][1] >> 6),
-         ('ecn', t[0][1] & 3),
-         ('total_length', t[1]),
-         ('identification', t[2]),
-         ('flags', t[3] >> 5),
-         ('fragment_offset', (t[3] & 31) << 8 | t[4]),
+    t = _HEADER.unpack_from(data, offset)
+    r = [('version', t[0] >> 4),
+         ('ihl', ihl := t[0] & 15),
+         ('dscp', t[1] >> 2),
+         ('ecn', t[1] & 3),
+         ('total_length', t[2]),
+         ('identification', t[3]),
+         ('flags', t[4] >> 13),
+         ('fragment_offset', t[4] & 0x1fff),
          ('ttl', t[5]),
-         ('protocol', proto := t[6]),
+         ('protocol', protocol := t[6]),
          ('header_checksum', t[7]),
-         ('source', int.from_bytes(t[8], 'big')),
-         ('destination', int.from_bytes(t[9], 'big'))]
-
-    if ihl > 5:
-        options_length = (ihl - 5) * 4
-        try:
-            r.append(('options', unpack(f'{options_length}s', data[20:20 + options_length])))
-        except error as e:
-            print(f"DEBUG got options of incorrect size: {e}")
-            r.append(('options', unpack(f'{len(data) - 20}s', data[20:])))
-
-    # save payload
-    # if we know the next proto, parse the payload
-    return r, (IP_PROTOS.get(proto, 'UNKNOWN'), data[ihl * 4:])
+         ('source', t[8]),
+         ('destination', t[9])]
+
+    header_length = ihl * 4
+    if header_length > 20 and (need is None or 'options' in need):
+        if len(data) - offset >= header_length:
+            r.append(('options', (bytes(data[offset + 20:offset + header_length]),)))
+        else:
+            print(f"DEBUG got options of incorrect size: expected {header_length - 20} bytes, "
+                  f"got {len(data) - offset - 20}")
+            r.append(('options', (bytes(data[offset + 20:]),)))
+
+    return r, (_NEXT.get(protocol, 'UNKNOWN'), data, offset + header_length)
+# --- end of generated parser ---
 
 
 def summary(par: dict):
@@ -1,20 +1,23 @@
-from struct import unpack
+from struct import Struct
 
-from .__constants import ETHER_TYPES
+# --- generated from pcc_in.json: parser ---
+_HEADER = Struct('!BBB3sH')
+_NEXT = {0x0800: 'ipv4', 0x0806: 'arp', 0x888e: 'dot1x_authentication'}
 
 
-def llc(data: bytes) -> (list, tuple):
-    if len(data) < 8:
-        return [], ('MALFORMED', f"LLC requires at least 8 bytes, got {len(data)}")
+def llc(data: memoryview, offset: int = 0, need=None) -> (list, tuple):
+    if len(data) - offset < 8:
+        return [], ('MALFORMED', f"LLC requires at least 8 bytes, got {len(data) - offset}")
 
-    t = unpack('!BBB3sH', data[:8])
+    t = _HEADER.unpack_from(data, offset)
     r = [('dsap', t[0]),
          ('ssap', t[1]),
          ('control_field', t[2]),
          ('organization_code', t[3]),
          ('type', _type := t[4])]
 
-    return r, (ETHER_TYPES.get(_type, 'UNKNOWN'), data[8:])
+    return r, (_NEXT.get(_type, 'UNKNOWN'), data, offset + 8)
+# --- end of generated parser ---
 
 
 def summary(par: dict):
@@ -1,72 +1,194 @@
-from struct import unpack
-from extensions import flatten_tuple
-
-
-def radiotap(data: bytes) -> (list, tuple):
-    if len(data) < 8:
-        return [], ('MALFORMED', f"Radiotap requires at least 8 bytes, got {len(data)}")
-
-    fcs_at_end = 0
+from struct import Struct
+
+_HEADER = Struct('<BBHI')
+_PRESENT = Struct('<I')
+# oui, sub namespace, skip length
+_VENDOR_NAMESPACE = Struct('<3sBH')
+
+# Present bit -> (alignment, layout, emitted field names). Alignment is counted from the start of the header
+FIELDS = {0: (8, Struct('<Q'), ('tsft',)),
+          1: (1, Struct('<B'), ('flags',)),
+          2: (1, Struct('<B'), ('data_rate',)),
+          3: (2, Struct('<HH'), ('channel_frequency', 'channel_flags')),
+          4: (2, Struct('<BB'), ('fhss_hop_set', 'fhss_hop_pattern')),
+          5: (1, Struct('<b'), ('dbm_antenna_signal',)),
+          6: (1, Struct('<b'), ('dbm_antenna_noise',)),
+          7: (2, Struct('<H'), ('lock_quality',)),
+          8: (2, Struct('<H'), ('tx_attenuation',)),
+          9: (2, Struct('<H'), ('db_tx_attenuation',)),
+          10: (1, Struct('<b'), ('dbm_tx_power',)),
+          11: (1, Struct('<B'), ('antenna',)),
+          12: (1, Struct('<B'), ('db_antenna_signal',)),
+          13: (1, Struct('<B'), ('db_antenna_noise',)),
+          14: (2, Struct('<H'), ('rx_flags',)),
+          15: (2, Struct('<H'), ('tx_flags',)),
+          16: (1, Struct('<B'), ('rts_retries',)),
+          17: (1, Struct('<B'), ('data_retries',)),
+          18: (4, Struct('<IHBB'), ('xchannel_flags', 'xchannel_frequency', 'xchannel_channel', 'xchannel_max_power')),
+          19: (1, Struct('<BBB'), ('mcs_information',)),
+          20: (4, Struct('<IHBx'), ('ampdu_reference', 'ampdu_flags', 'ampdu_delimiter_crc')),
+          21: (2, Struct('<HBB4sBBH'), ('vht_known', 'vht_flags', 'vht_bandwidth', 'vht_mcs_nss', 'vht_coding',
+                                        'vht_group_id', 'vht_partial_aid')),
+          22: (8, Struct('<QHBB'), ('timestamp', 'timestamp_accuracy', 'timestamp_unit_position', 'timestamp_flags')),
+          23: (2, Struct('<6H'), ('he_data1', 'he_data2', 'he_data3', 'he_data4', 'he_data5', 'he_data6')),
+          24: (2, Struct('<HH4s4s'), ('he_mu_flags1', 'he_mu_flags2', 'he_mu_ru_channel1', 'he_mu_ru_channel2')),
+          25: (2, Struct('<HHBB'), ('he_mu_user_field1', 'he_mu_user_field2', 'he_mu_user_position',
+                                   'he_mu_user_known')),
+          26: (1, Struct('<B'), ('zero_length_psdu_type',)),
+          27: (2, Struct('<HH'), ('lsig_data1', 'lsig_data2'))}
+
+# Decoding plans by header length and present words. Field offsets only depend on those,
+# so every distinct bitmap is laid out once and then read with a single unpack
+_PLANS = {}
+PLAN_CACHE_SIZE = 256
+
+_TSFT = 0
+_FLAGS = 1
+# Present bits that only control the bitmap and carry no data
+_RADIOTAP_NAMESPACE = 1 << 29
+_VENDOR_NAMESPACE_NEXT = 1 << 30
+_EXT = 1 << 31
+_DATA_BITS = (1 << 29) - 1
+
+
+def radiotap(data: memoryview, offset: int = 0, need=None) -> (list, tuple):
+    if len(data) - offset < 8:
+        return [], ('MALFORMED', f"Radiotap requires at least 8 bytes, got {len(data) - offset}")
 
     # Unpacks the first present dword
-    t = unpack('<BBHI', data[:8])
+    t = _HEADER.unpack_from(data, offset)
     r = [('version', t[0]),
          ('pad', t[1]),
          ('length', (length := t[2])),
          ('present', (present := t[3]))]
 
-    c = '0' * (32 - len(a := bin(present)[2:])) + a
+    end = offset + length
+    if len(data) < end:
+        return r, ('MALFORMED', f"Radiotap header is {length} bytes long, got {len(data) - offset}")
 
-    # Currently a placeholder for other present dwords
-    c_else = '0' * (32 - len(a := bin(present)[2:])) + a
-    last = 8
-    while c_else[0] == '1':
-        present_else = unpack('<I', data[last:last + 4])[0]
-        c_else = '0' * (32 - len(a := bin(present_else)[2:])) + a
+    words = [present]
+    last = offset + 8
+    while words[-1] & _EXT:
+        if last + 4 > end:
+            return r, ('MALFORMED', f"Radiotap present bitmap runs past the {length} bytes header")
+        words.append(_PRESENT.unpack_from(data, last)[0])
         last += 4
 
-    radio_data = data[last:]
-
-    if c[30] == '1':
-        t, fcs_at_end = _flags(unpack('<s', radio_data[:1])[0])
-        r = flatten_tuple(r, t, 'flags')
-        radio_data = radio_data[1:]
-    if c[29] == '1':
-        r.append(('data_rate', unpack('<B', radio_data[:1])[0]))
-    radio_data = radio_data[1:]
-    if c[28] == '1':
-        t = unpack('<H2s', radio_data[:4])
-        r.append(('channel_frequency', t[0]))
-        r = flatten_tuple(r, _channel_flags(t[1]), 'channel_flags')
-        radio_data = radio_data[4:]
-    if c[26] == '1':
-        r.append(('dbm_antenna_signal', unpack('<b', radio_data[:1])[0]))
-        radio_data = radio_data[1:]
-    if c[20] == '1':
-        r.append(('antenna', unpack('<B', radio_data[:1])[0]))
-        radio_data = radio_data[1:]
-    if c[17] == '1':
-        r = flatten_tuple(r, _rx_flags(unpack('<2s', radio_data[:2])[0]), 'rx_flags')
-        radio_data = radio_data[2:]
-    if c[12] == '1':
-        r.append(('mcs_information', unpack('<BBB', radio_data[:3])))
-        radio_data = radio_data[3:]
-
+    fcs_at_end = 0
+    if need is not None and not need:
+        # Only the FCS flag is needed then, and TSFT is the single field that can precede it
+        if present & 1 << _FLAGS:
+            pos = last
+            if present & 1 << _TSFT:
+                pos += -(pos - offset) % 8 + 8
+            # Like in _plan, flags that don't fit in the header (or behind a TSFT that doesn't) aren't located
+            if pos < end:
+                fcs_at_end = data[pos] >> 4 & 1
+    else:
+        key = (length, *words)
+        if (plan := _PLANS.get(key)) is None:
+            plan, cacheable = _plan(data, offset, last - offset, length, words)
+            if cacheable and len(_PLANS) < PLAN_CACHE_SIZE:
+                _PLANS[key] = plan
+        layout, fields, fcs = plan
+        values = layout.unpack_from(data, offset)
+        if fcs is not None:
+            fcs_at_end = values[fcs] >> 4 & 1
+        # Plain fields cost less to emit than to filter, so need only gates the expanded ones
+        for expand, names, keys, start, stop in fields:
+            if expand is None:
+                r.extend(zip(names, values[start:stop]))
+            elif need is None or not need.isdisjoint(keys):
+                r.extend(zip(names, expand(values[start:stop])))
+
+    # Slicing a memoryview doesn't copy the frame
     if fcs_at_end:
         data = data[:-4]
 
-    return r, ('dot11_header', data[length:])
+    return r, ('dot11_header', data, end)
+
+
+# Lays out the fields of every namespace in bitmap order, starting at pos bytes into the header.
+# Returns (layout, fields, index of the flags value) and whether the plan holds for other frames with the same bitmap
+def _plan(data: memoryview, offset: int, pos: int, length: int, words: list) -> (tuple, bool):
+    fmt = ['<', f'{pos}x']
+    fields = []
+    count = 0
+    fcs = None
+    cacheable = True
+    # Fields of the n-th radiotap namespace after the first one are named ns{n}.field
+    prefix = None
+    namespace = 0
+    vendor = False
+    # Set for the first word of a namespace, the ones after it extend it to bits 32 and up
+    fresh = True
+    for word in words:
+        if vendor:
+            if fresh:
+                # Vendor data is opaque and only its header tells how much of it to skip, so it's read from this frame
+                cacheable = False
+                pad = -pos % 2
+                if pos + pad + _VENDOR_NAMESPACE.size > length:
+                    break
+                skip = _VENDOR_NAMESPACE.size + _VENDOR_NAMESPACE.unpack_from(data, offset + pos + pad)[2]
+                if pos + pad + skip > length:
+                    break
+                fmt.append(f'{pad + skip}x')
+                pos += pad + skip
+        elif bits := word & _DATA_BITS:
+            if not fresh:
+                # No field is defined past bit 31, so nothing behind it can be located
+                break
+            located = True
+            while bits:
+                bit = (bits & -bits).bit_length() - 1
+                bits &= bits - 1
+                if bit not in FIELDS:
+                    # TLVs (bit 28) have no fixed size, so neither they nor anything after them can be located
+                    located = False
+                    break
+                align, layout, names = FIELDS[bit]
+                pad = -pos % align
+                if pos + pad + layout.size > length:
+                    located = False
+                    break
+                n = len(layout.unpack(bytes(layout.size)))
+                if bit == _FLAGS and prefix is None:
+                    fcs = count
+                expand, emitted = _EXPANDED.get(bit, (None, names))
+                if prefix is not None:
+                    emitted = tuple(f'{prefix}.{name}' for name in emitted)
+                if expand is None and fields and fields[-1][0] is None:
+                    # Runs of plain fields are emitted together
+                    _, run, keys, start, _ = fields.pop()
+                    fields.append((None, run + emitted, keys, start, count + n))
+                else:
+                    fields.append((expand, emitted, names if prefix is None else (prefix,), count, count + n))
+                fmt.append(f'{pad}x{layout.format[1:]}')
+                pos += pad + layout.size
+                count += n
+            if not located:
+                break
+
+        fresh = bool(word & (_RADIOTAP_NAMESPACE | _VENDOR_NAMESPACE_NEXT))
+        if word & _RADIOTAP_NAMESPACE:
+            namespace += 1
+            prefix = f'ns{namespace}'
+            vendor = False
+        elif word & _VENDOR_NAMESPACE_NEXT:
+            vendor = True
+    return (Struct(''.join(fmt)), fields, fcs), cacheable
 
 
 def summary(par: dict) -> str:
     t = []
-    if par['radiotap.channel_flags.spectrum_5gz']:
+    if par.get('radiotap.channel_flags.spectrum_5gz'):
         t.append('5 GHz')
-    elif par['radiotap.channel_flags.spectrum_2gz']:
+    elif par.get('radiotap.channel_flags.spectrum_2gz'):
         t.append('2.4 GHz')
-    if par['radiotap.channel_frequency']:
+    if par.get('radiotap.channel_frequency'):
         t.append(f"ch {calc_channel_number(par['radiotap.channel_frequency'])}")
-    if par['radiotap.dbm_antenna_signal']:
+    if par.get('radiotap.dbm_antenna_signal'):
         t.append(f"{par['radiotap.dbm_antenna_signal']} dbm")
     return ' '.join(t)
 
@@ -80,31 +202,34 @@ def calc_channel_number(freq):
         return int(freq / 5 - 1000)
 
 
-def _flags(data: bytes) -> (list, int):
-    return [('short_gi', data[0] >> 7),
-            ('bad_fcs', (data[0] >> 6) & 1),
-            ('data_pad', (data[0] >> 5) & 1),
-            ('fcs_at_end', fcs_at_end := data[0] >> 4 & 1),
-            ('fragmentation', (data[0] >> 3) & 1),
-            ('wep', (data[0] >> 2) & 1),
-            ('preamble', (data[0] >> 1) & 1),
-            ('cfp', data[0] & 1)], fcs_at_end
-
-
-def _channel_flags(data: bytes) -> list:
-    return [('quarter_rate_channel', data[1] >> 7),
-            ('half_rate_channel', (data[1] >> 6) & 1),
-            ('static_turbo', (data[1] >> 5) & 1),
-            ('gsm', (data[1] >> 4) & 1),
-            ('gfsk', (data[1] >> 3) & 1),
-            ('dynamic_cck_ofdm', (data[1] >> 2) & 1),
-            ('passive', (data[1] >> 1) & 1),
-            ('spectrum_5gz', data[1] & 1),
-            ('spectrum_2gz', (data[0] >> 7) & 1),
-            ('ofdm', (data[0] >> 6) & 1),
-            ('cck', (data[0] >> 5) & 1),
-            ('turbo', (data[0] >> 4) & 1)]
-
-
-def _rx_flags(data: bytes) -> list:
-    return [('bad_plcp', (data[0] >> 1) & 1)]
+# Expanders of the unpacked values of the fields listed in _EXPANDED
+def _flags(t: tuple) -> tuple:
+    data = t[0]
+    return (data >> 7, (data >> 6) & 1, (data >> 5) & 1, (data >> 4) & 1,
+            (data >> 3) & 1, (data >> 2) & 1, (data >> 1) & 1, data & 1)
+
+
+def _channel(t: tuple) -> tuple:
+    frequency, data = t
+    return (frequency, data >> 15, (data >> 14) & 1, (data >> 13) & 1, (data >> 12) & 1, (data >> 11) & 1,
+            (data >> 10) & 1, (data >> 9) & 1, (data >> 8) & 1, (data >> 7) & 1, (data >> 6) & 1, (data >> 5) & 1,
+            (data >> 4) & 1)
+
+
+def _rx_flags(t: tuple) -> tuple:
+    return (t[0] >> 1) & 1,
+
+
+def _mcs(t: tuple) -> tuple:
+    return t,
+
+
+_CHANNEL_FLAGS = ('quarter_rate_channel', 'half_rate_channel', 'static_turbo', 'gsm', 'gfsk', 'dynamic_cck_ofdm',
+                  'passive', 'spectrum_5gz', 'spectrum_2gz', 'ofdm', 'cck', 'turbo')
+
+# Fields that are expanded into flags instead of being emitted as unpacked -> (expander, emitted field names)
+_EXPANDED = {1: (_flags, tuple(f'flags.{name}' for name in ('short_gi', 'bad_fcs', 'data_pad', 'fcs_at_end',
+                                                            'fragmentation', 'wep', 'preamble', 'cfp'))),
+             3: (_channel, ('channel_frequency', *(f'channel_flags.{name}' for name in _CHANNEL_FLAGS))),
+             14: (_rx_flags, ('rx_flags.bad_plcp',)),
+             19: (_mcs, ('mcs_information',))}
@@ -1,19 +1,22 @@
-from struct import unpack
+from struct import Struct
 
-from .__constants import UDP_SERVICES
+# --- generated from pcc_in.json: parser ---
+_HEADER = Struct('!HHHH')
+_NEXT = {67: 'dhcp', 68: 'dhcp'}
 
 
-def udp(data: bytes) -> (list, tuple):
-    if len(data) < 8:
-        return [], ('MALFORMED', f"UDP requires at least 8 bytes, got {len(data)}")
+def udp(data: memoryview, offset: int = 0, need=None) -> (list, tuple):
+    if len(data) - offset < 8:
+        return [], ('MALFORMED', f"UDP requires at least 8 bytes, got {len(data) - offset}")
 
-    t = unpack('!HHHH', data[:8])
+    t = _HEADER.unpack_from(data, offset)
     r = [('source_port', t[0]),
-         ('destination_port', dst_port := t[1]),
+         ('destination_port', destination_port := t[1]),
          ('length', length := t[2]),
          ('checksum', t[3])]
 
-    return r, (UDP_SERVICES.get(dst_port, 'UNKNOWN'), data[8:length+8])
+    return r, (_NEXT.get(destination_port, 'UNKNOWN'), data[:offset + length], offset + 8)
+# --- end of generated parser ---
 
 
 def summary(par: dict):
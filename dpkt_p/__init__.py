@@ -4,7 +4,7 @@ import dpkt
 import json
 import timeit
 
-from extensions import Session, Rule, ipv4_to_bytes, ipv4_to_int, mac_to_bytes, bytes_to_ipv4, bytes_to_mac, COMPARISONS
+from extensions import NS_PER_SECOND, Session, Rule, ipv4_to_bytes, ipv4_to_int, mac_to_bytes, bytes_to_ipv4, bytes_to_mac, RuleNetwork, attr_accessor, attr_source, decode_value
 
 fields_values_decoder = {
     "arp.sender_ip": lambda a: ipv4_to_bytes(a) if a is not None else b"",
@@ -93,34 +93,43 @@ fields_names_decoder = {
 }
 
 
-def do(path, rules):
+# If manager (see RuleManager) is given, it's polled between packets and rules are swapped when its file changes.
+# If queue (see ActionQueue) is given, print actions are written by its worker thread.
+# If profiler (see Profiler) is given, it counts conditions and times parsing, matching and actions. compiled is ignored
+def do(path, rules, compiled=False, debug=False, manager=None, queue=None, profiler=None):
     for rule in rules:
-        for cond in rule.conditions:
-            cond.val = fields_values_decoder.get(cond.pth, lambda a: a)(cond.val)
-            cond.pth = fields_names_decoder.get(cond.pth, cond.pth)
+        prepare_rule(rule, queue)
+    if manager:
+        manager.bind(lambda rule: prepare_rule(rule, queue))
+    network, match = build(rules, compiled, debug, profiler)
+    parse = profiler.parse(Packet) if profiler else Packet
     s = Session(path)
     start = timeit.default_timer()
     for pkt in s:
-        pkt = Packet(*pkt)
-        for rule in rules:
-            rule_matched = True
-            for cond in rule.conditions:
-                obj = pkt
-                for step in cond.pth.split("."):
-                    obj = getattr(obj, step, None)
-                if (a := cond.act) in COMPARISONS:
-                    condition_matched = COMPARISONS[a](obj, cond.val)
-                else:
-                    print(f"WARNING: unknown condition in rule {rule.name}: {cond}")
-                    condition_matched = False
-                if not condition_matched:
-                    rule_matched = False
-                    break
-            if rule_matched:
-                rule.do(pkt)
+        if manager and manager.poll() is not None:
+            network, match = build(manager.rules, compiled, debug, profiler)
+        pkt = parse(*pkt)
+        for rule in match(pkt):
+            rule.do(pkt)
     return timeit.default_timer() - start
 
 
+# Converts values of the rule into the form parsers produce. Done once for every rule
+def prepare_rule(rule, queue=None):
+    for cond in rule.conditions:
+        cond.val = decode_value(cond, fields_values_decoder)
+        cond.pth = fields_names_decoder.get(cond.pth, cond.pth)
+    rule.bind(lambda pth: attr_accessor(fields_names_decoder.get(pth, pth)), queue)
+
+
+# Returns network of the rules and its matcher
+def build(rules, compiled=False, debug=False, profiler=None):
+    network = RuleNetwork(rules, attr_accessor, lambda pkt: pkt.protos, PROTOS)
+    if profiler:
+        return network, profiler.match(network)
+    return network, (network.compile(attr_source, 'pkt.protos', debug) if compiled else network.match)
+
+
 class Packet:
     __slots__ = "time", "protos", "ll_type", "radiotap", "ieee80211", "llc", "ip", "tcp", "arp", "udp", "ieee8021x", "eap", "dhcp"
 
@@ -147,11 +156,18 @@ class Packet:
                 else:
                     break
         except dpkt.dpkt.NeedData:
-            #print(f"MALFORMED at {datetime.fromtimestamp(time)}")
+            #print(f"MALFORMED at {datetime.fromtimestamp(time / NS_PER_SECOND)}")
             pass
 
+    def get_time(self):
+        return datetime.fromtimestamp(self.time / NS_PER_SECOND)
+
+    # Packets are complete once parsed and never change, the ActionQueue worker can render this one as it is
+    def freeze(self):
+        return self
+
     def summary(self):
-        summ = f"[{datetime.fromtimestamp(self.time)}] | "
+        summ = f"[{self.get_time()}] | "
         for proto in self.protos:
             if proto == "radiotap":
                 if self.radiotap.channel_present:
@@ -198,6 +214,10 @@ class Packet:
         return summ.rstrip("| ")
 
 
+# Protocols that Packet can hold
+PROTOS = set(Packet.__slots__) - {"time", "protos", "ll_type"}
+
+
 ieee80211_c_dec = {8: "bar", 9: "back", 10: "ps_poll", 11: "rts", 12: "cts", 13: "ack", 14: "cf_end"},
 ieee80211_m_info = {0b0000: "Association Request",
                     0b0001: "Association Response",
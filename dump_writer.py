@@ -1,14 +1,22 @@
-from dpkt import pcap
+from struct import Struct
+
+from extensions import NS_PER_SECOND, PCAP_HEADER
+
+PCAP_RECORD = Struct('<IIII')
 
 
 class DumpWriter:
+    # Writes nanosecond pcaps directly from the integer packet time, no float or Decimal conversion
     def __init__(self):
         self.files_opened = {}
 
     def write(self, rname, rgroup, file, pkt):
         if file not in self.files_opened:
-            self.files_opened[file] = pcap.Writer(open(file, 'wb'), linktype=pkt.ll_type, nano=True)
-        self.files_opened[file].writepkt_time(pkt.data, pkt.time)
+            f = open(file, 'wb')
+            f.write(Struct('<' + PCAP_HEADER).pack(0xa1b23c4d, 2, 4, 0, 0, 65535, pkt.ll_type))
+            self.files_opened[file] = f
+        sec, nsec = divmod(pkt.time, NS_PER_SECOND)
+        self.files_opened[file].write(PCAP_RECORD.pack(sec, nsec, len(pkt.data), len(pkt.data)) + pkt.data)
 
     def close(self):
         for file in self.files_opened.values():
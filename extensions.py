@@ -1,8 +1,36 @@
 import binascii
 import pickle
-import dpkt
-from bisect import bisect_left
+from bisect import bisect_right
+from collections import Counter, OrderedDict, deque
 from decimal import Decimal
+from operator import attrgetter
+from struct import Struct, error
+from time import perf_counter_ns
+
+
+# Membership checks never fail on unhashable field values, such values just aren't in the set
+def _in(a, b):
+    try:
+        return a in b
+    except TypeError:
+        return False
+
+
+def _not_in(a, b):
+    try:
+        return a not in b
+    except TypeError:
+        return True
+
+
+# Plain substring search, RuleNetwork replaces it with an AhoCorasick automaton shared by all patterns of the path
+def _contains_any(a, b):
+    if isinstance(a, str):
+        a = a.encode('utf-8')
+    return isinstance(a, bytes) and any(p in a for p in b)
+
+# All packet times are integer nanoseconds since the epoch
+NS_PER_SECOND = 1_000_000_000
 
 COMPARISONS = {
     '==': lambda a, b: False if a is None else a == b,
@@ -13,8 +41,15 @@ COMPARISONS = {
     '>': lambda a, b: False if a is None else a > b,
     'y': lambda a, b: a is not None,
     'n': lambda a, b: a is None,
+    'in': lambda a, b: False if a is None else _in(a, b),
+    'not in': lambda a, b: False if a is None else _not_in(a, b),
+    'in_cidr': lambda a, b: False if a is None else a in b,
+    'contains_any': lambda a, b: False if a is None else _contains_any(a, b),
 }
 
+# Operators whose val is a list of values, it's decoded into a frozenset once when rules are loaded
+SET_OPERATORS = ('in', 'not in')
+
 
 class Condition:
     __slots__ = 'pth', 'act', 'val'
@@ -33,49 +68,127 @@ class Action:
         self.obj = obj
 
 
+# Default hard cap on number of keys a group_by rule keeps state for
+GROUP_LIMIT = 65536
+
+
+# Window and cooldown of one key of a group_by rule
+class GroupState:
+    __slots__ = 'times', 'inactive_until', 'last_seen'
+
+    def __init__(self, target):
+        self.times = deque(maxlen=max(target, 1))
+        self.inactive_until = 0
+        self.last_seen = 0
+
+
 class Rule:
-    __slots__ = 'name', 'conditions', 'actions', 'target', 'interval', 'timeout', 'counter', 'times', 'last_possible', 'inactive_until'
+    __slots__ = 'name', 'conditions', 'actions', 'target', 'interval', 'timeout', 'counter', 'times', 'inactive_until', \
+                'group_by', 'group_limit', 'groups', 'key_of', 'evicted', 'queue'
 
     def __init__(self, d):
         self.name = d['name']
         self.conditions = [Condition(i.get('pth'), i['act'], i.get('val')) for i in d['conditions']]
         self.actions = [Action(i['act'], i['obj']) for i in d['actions']]
         self.target = d['target']
-        self.timeout = d['timeout']
-        self.interval = Decimal(d['interval'])
+        self.timeout = seconds_to_ns(d['timeout'])
+        self.interval = seconds_to_ns(d['interval'])
         self.counter = 0
-        self.times = []
-        self.last_possible = 0
+        # Times of matched packets inside the current interval. Never holds more than target items
+        self.times = deque(maxlen=max(self.target, 1))
         self.inactive_until = 0
+        # With group_by every value of that field gets its own window and cooldown instead of times/inactive_until.
+        # Keys are kept in LRU order, so idle ones are dropped from the front and the table never exceeds group_limit
+        self.group_by = d.get('group_by')
+        self.group_limit = d.get('group_limit', GROUP_LIMIT)
+        self.groups = OrderedDict() if self.group_by else None
+        self.key_of = None
+        # Keys dropped because of group_limit before they went idle
+        self.evicted = 0
+        # If set, print actions are handed to this ActionQueue instead of being printed in the packet loop
+        self.queue = None
+
+    # Gives the rule backend's accessor to read its group_by field (see RuleNetwork for field_accessor)
+    # and the queue for its actions
+    def bind(self, field_accessor, queue=None):
+        if self.group_by:
+            self.key_of = field_accessor(self.group_by)
+        self.queue = queue
 
     def add(self, pkt):
+        if self.groups is not None:
+            return self.add_grouped(pkt)
         time = pkt.time
         if time > self.inactive_until:
-            if time > self.last_possible:
-                self.times = self.times[bisect_left(self.times, time-self.interval):]
-            self.times.append(time)
-            if len(self.times) == self.target:
-                self.times = []
+            times = self.times
+            expired = time - self.interval
+            while times and times[0] < expired:
+                times.popleft()
+            times.append(time)
+            if len(times) == self.target:
+                times.clear()
                 self.inactive_until = time + self.timeout
                 self.do(pkt)
 
-    def do(self, pkt):
+    def add_grouped(self, pkt):
+        key = self.key_of(pkt)
+        time = pkt.time
+        groups = self.groups
+        # A key unseen for longer than both interval and timeout has an empty window and no cooldown,
+        # so dropping it changes nothing
+        idle = time - max(self.interval, self.timeout)
+        while groups and next(iter(groups.values())).last_seen < idle:
+            groups.popitem(last=False)
+        state = groups.get(key)
+        if state is None:
+            if len(groups) >= self.group_limit:
+                groups.popitem(last=False)
+                self.evicted += 1
+            state = groups[key] = GroupState(self.target)
+        else:
+            groups.move_to_end(key)
+        state.last_seen = time
+        if time > state.inactive_until:
+            times = state.times
+            expired = time - self.interval
+            while times and times[0] < expired:
+                times.popleft()
+            times.append(time)
+            if len(times) == self.target:
+                times.clear()
+                state.inactive_until = time + self.timeout
+                self.do(pkt, key)
+
+    def do(self, pkt, key=None):
         for action in self.actions:
             if action.act == 'print':
-                print(f'Rule {self.name} ringed at {pkt.get_time()}')
-                if action.obj == 'summary':
-                    print(pkt.summary())
-                elif action.obj == 'show':
-                    print(pkt.show())
+                if self.queue:
+                    self.queue.put(self, pkt, key, action.obj)
+                else:
+                    print(self.render(pkt, key, action.obj))
             elif action.act == 'count':
                 self.counter += 1
 
+    # Text of a print action. With a queue it's called by the worker on a frozen copy of the packet (see ActionQueue)
+    def render(self, pkt, key, obj):
+        if self.group_by:
+            r = [f'Rule {self.name} ringed at {pkt.get_time()} for {self.group_by} {get_bytes_to_mac(key, key)}']
+        else:
+            r = [f'Rule {self.name} ringed at {pkt.get_time()}']
+        if obj == 'summary':
+            r.append(pkt.summary())
+        elif obj == 'show':
+            r.append(pkt.show())
+        return '\n'.join(r)
+
     def report(self, show_name=False, show_conditions=False, show_actions=False, show_counter=False, show_match_target=True):
         r = []
         if show_name:
             r.append(self.name)
         if show_counter:
             r.append(f'\t{self.counter}\n')
+            if self.groups is not None:
+                r.append(f'\t{len(self.groups)} {self.group_by} keys tracked, {self.evicted} evicted\n')
         if show_conditions:
             r.append('  conditions:\n')
             for cond in self.conditions:
@@ -90,18 +203,580 @@ class Rule:
         return r
 
 
+# Marks a path value that wasn't fetched from the packet yet
+_UNSET = object()
+
+
+# A single distinct (pth, act, val) test shared by every rule that uses it
+class AlphaNode:
+    __slots__ = 'index', 'pth', 'act', 'val', 'test', 'path_index', 'get'
+
+    def __init__(self, index, cond, path_index, get):
+        self.index = index
+        self.pth = cond.pth
+        self.act = cond.act
+        self.val = cond.val
+        self.test = COMPARISONS.get(cond.act, lambda a, b: False)
+        self.path_index = path_index
+        self.get = get
+
+
+# A node of the discrimination tree. Rules with the same leading conditions share the nodes
+class RuleNode:
+    __slots__ = 'alpha', 'children', 'dispatch', 'rules'
+
+    def __init__(self, alpha=None):
+        self.alpha = alpha
+        self.children = {}
+        # (alpha, {val: child}) for == children that share a path, see RuleNetwork.index
+        self.dispatch = []
+        self.rules = []
+
+
+"""
+Rete-style network compiled from a list of rules.
+Identical (pth, act, val) conditions are merged into one AlphaNode and rules are stored in a tree by their conditions,
+so a shared prefix is tested once. Every field is fetched and every distinct condition is evaluated at most once per
+packet, so the cost grows with the number of distinct conditions instead of rules * conditions.
+Children that test the same field with == against different constants are put into a dict, so a watchlist of
+hundreds of rules that differ only in one value costs a single lookup.
+field_accessor(pth) must return a function that takes a packet and returns the field's value or None.
+If protos_of(pkt) is given, rules are split into buckets by the protocols they need (see required_protos) and only
+buckets whose protocols are all in protos_of(pkt) are evaluated
+"""
+class RuleNetwork:
+    def __init__(self, rules, field_accessor, protos_of=None, known_protos=()):
+        self.rules = rules
+        self.alphas = {}
+        self.paths = {}
+        self.scanners = {}
+        self.protos_of = protos_of
+        self.roots = {}
+        self.selected = {}
+        for i, rule in enumerate(rules):
+            need = required_protos(rule, known_protos) if protos_of else frozenset()
+            if need not in self.roots:
+                self.roots[need] = RuleNode()
+            node = self.roots[need]
+            for cond in rule.conditions:
+                if cond.act not in COMPARISONS:
+                    print(f'WARNING: unknown condition in rule {rule.name}: {cond.pth} {cond.act} {cond.val}')
+                alpha = self._alpha(cond, field_accessor)
+                if alpha.index not in node.children:
+                    node.children[alpha.index] = RuleNode(alpha)
+                node = node.children[alpha.index]
+            node.rules.append(i)
+        self.automata()
+        self.index()
+
+    # contains_any conditions on the same path share one AhoCorasick automaton. The path gets a virtual twin
+    # (pth, 'contains_any') whose value is the set of indices of alphas with patterns found in the field,
+    # so the field is scanned once per packet and every condition is a set lookup
+    def automata(self):
+        groups = {}
+        for alpha in self.alphas.values():
+            if alpha.act == 'contains_any':
+                groups.setdefault(alpha.pth, []).append(alpha)
+        for pth, alphas in groups.items():
+            scan = AhoCorasick((p, alpha.index) for alpha in alphas for p in alpha.val).scan
+            get = self.paths[pth][1]
+            path_index = len(self.paths)
+            self.paths[(pth, 'contains_any')] = (path_index, lambda pkt, get=get, scan=scan: scan(get(pkt)))
+            self.scanners[path_index] = scan
+            for alpha in alphas:
+                alpha.path_index = path_index
+                alpha.get = self.paths[(pth, 'contains_any')][1]
+                alpha.test = lambda hits, val, index=alpha.index: index in hits
+
+    # Moves == children with literal values into hash tables keyed by value, one table per path.
+    # Values that are equal to each other but of different types (1 and True) stay as children
+    def index(self):
+        stack = list(self.roots.values())
+        while stack:
+            node = stack.pop()
+            groups = {}
+            for child in node.children.values():
+                alpha = child.alpha
+                if alpha.act == '==' and type(alpha.val) in _LITERALS:
+                    groups.setdefault(alpha.path_index, []).append(child)
+            for group in groups.values():
+                if len(group) < INDEX_MIN_CHILDREN:
+                    continue
+                table = {}
+                for child in group:
+                    if child.alpha.val not in table:
+                        table[child.alpha.val] = child
+                        del node.children[child.alpha.index]
+                node.dispatch.append((group[0].alpha, table))
+            stack.extend(node.children.values())
+            for _, table in node.dispatch:
+                stack.extend(table.values())
+
+    def _alpha(self, cond, field_accessor):
+        if cond.pth not in self.paths:
+            self.paths[cond.pth] = (len(self.paths), field_accessor(cond.pth))
+        path_index, get = self.paths[cond.pth]
+        key = condition_key(cond)
+        if key not in self.alphas:
+            self.alphas[key] = AlphaNode(len(self.alphas), cond, path_index, get)
+        return self.alphas[key]
+
+    # Returns roots of the buckets that can match a packet with given protocols
+    def select(self, protos):
+        key = tuple(protos)
+        roots = self.selected.get(key)
+        if roots is None:
+            protos = set(key)
+            roots = self.selected[key] = [root for need, root in self.roots.items() if need <= protos]
+        return roots
+
+    # Returns matched rules in the order they were given
+    def match(self, pkt):
+        values = [_UNSET] * len(self.paths)
+        results = [None] * len(self.alphas)
+        matched = []
+        stack = list(self.select(self.protos_of(pkt)) if self.protos_of else self.roots.values())
+        while stack:
+            node = stack.pop()
+            if node.rules:
+                matched.extend(node.rules)
+            for alpha, table in node.dispatch:
+                v = values[alpha.path_index]
+                if v is _UNSET:
+                    v = values[alpha.path_index] = alpha.get(pkt)
+                try:
+                    child = table.get(v)
+                except TypeError:
+                    continue
+                if child is not None:
+                    stack.append(child)
+            for child in node.children.values():
+                alpha = child.alpha
+                r = results[alpha.index]
+                if r is None:
+                    v = values[alpha.path_index]
+                    if v is _UNSET:
+                        v = values[alpha.path_index] = alpha.get(pkt)
+                    r = results[alpha.index] = bool(alpha.test(v, alpha.val))
+                if r:
+                    stack.append(child)
+        matched.sort()
+        return [self.rules[i] for i in matched]
+
+    # Same as match, but counts every evaluation. cond_stats[alpha.index] and table_stats[id(table)] are
+    # [evaluations, passes, ns] lists for conditions and == indexes, bucket_stats[id(root)] counts selected buckets
+    def profile(self, pkt, cond_stats, table_stats, bucket_stats):
+        clock = perf_counter_ns
+        values = [_UNSET] * len(self.paths)
+        results = [None] * len(self.alphas)
+        matched = []
+        stack = list(self.select(self.protos_of(pkt)) if self.protos_of else self.roots.values())
+        for root in stack:
+            bucket_stats[id(root)] += 1
+        while stack:
+            node = stack.pop()
+            if node.rules:
+                matched.extend(node.rules)
+            for alpha, table in node.dispatch:
+                t = clock()
+                v = values[alpha.path_index]
+                if v is _UNSET:
+                    v = values[alpha.path_index] = alpha.get(pkt)
+                try:
+                    child = table.get(v)
+                except TypeError:
+                    child = None
+                s = table_stats[id(table)]
+                s[0] += 1
+                s[2] += clock() - t
+                if child is not None:
+                    s[1] += 1
+                    cond_stats[child.alpha.index][1] += 1
+                    stack.append(child)
+            for child in node.children.values():
+                alpha = child.alpha
+                r = results[alpha.index]
+                if r is None:
+                    t = clock()
+                    v = values[alpha.path_index]
+                    if v is _UNSET:
+                        v = values[alpha.path_index] = alpha.get(pkt)
+                    r = results[alpha.index] = bool(alpha.test(v, alpha.val))
+                    s = cond_stats[alpha.index]
+                    s[0] += 1
+                    s[1] += r
+                    s[2] += clock() - t
+                if r:
+                    stack.append(child)
+        matched.sort()
+        return [self.rules[i] for i in matched]
+
+    # Generates python code of the whole network as nested ifs and returns it as a function that works like match.
+    # field_source(pth) must return an expression that takes the field's value from a packet named pkt.
+    # Fields and conditions used in several places are saved into locals, constants are put into the code.
+    # protos_source is an expression for protocols of pkt, used to check buckets if the network has them.
+    # Indexed children become functions b0, b1... that are looked up by value in dicts d0, d1...
+    # If debug is set, prints the generated code
+    def compile(self, field_source, protos_source=None, debug=False):
+        alpha_uses = Counter()
+        path_uses = Counter()
+        stack = list(self.roots.values())
+        while stack:
+            node = stack.pop()
+            for alpha, table in node.dispatch:
+                path_uses[alpha.path_index] += 1
+                stack.extend(table.values())
+            for child in node.children.values():
+                alpha_uses[child.alpha.index] += 1
+                path_uses[child.alpha.path_index] += 1
+                stack.append(child)
+
+        namespace = {'rules': self.rules}
+        lines = ['def match(pkt):', '    m = []']
+        if self.protos_of:
+            lines.append(f'    protos = {protos_source}')
+        branches = []
+        for need, root in self.roots.items():
+            if need:
+                lines.append(f"    if {' and '.join(f'{i!r} in protos' for i in sorted(need))}:")
+                self._emit(root, 2, set(), lines, namespace, field_source, alpha_uses, path_uses, branches)
+            else:
+                self._emit(root, 1, set(), lines, namespace, field_source, alpha_uses, path_uses, branches)
+        lines.extend(['    m.sort()', '    return [rules[i] for i in m]'])
+        self.source = '\n'.join(lines + branches) + '\n'
+        if debug:
+            print(self.source)
+        exec(compile(self.source, '<compiled rules>', 'exec'), namespace)
+        return namespace['match']
+
+    # Writes code for children of the node. avail holds locals that are already computed in the enclosing blocks
+    # branches collects code of functions and dicts for indexed children
+    def _emit(self, node, depth, avail, lines, namespace, field_source, alpha_uses, path_uses, branches):
+        indent = '    ' * depth
+        for i in node.rules:
+            lines.append(f'{indent}m.append({i})')
+        for alpha, table in node.dispatch:
+            v = f'v{alpha.path_index}'
+            if v not in avail:
+                if path_uses[alpha.path_index] == 1:
+                    v = f'({field_source(alpha.pth)})'
+                else:
+                    lines.append(f'{indent}{v} = {field_source(alpha.pth)}')
+                    avail.add(v)
+            d = f'd{len(branches)}'
+            entries = []
+            for val, child in table.items():
+                b = f'b{len(branches)}'
+                body = ['', f'def {b}(pkt, m):']
+                branches.append('')
+                self._emit(child, 1, set(), body, namespace, field_source, alpha_uses, path_uses, branches)
+                branches.extend(body)
+                entries.append(f'{val!r}: {b}')
+            branches.extend(['', f"{d} = {{{', '.join(entries)}}}"])
+            lines.extend([f'{indent}try:',
+                          f'{indent}    b = {d}.get({v})',
+                          f'{indent}except TypeError:',
+                          f'{indent}    b = None',
+                          f'{indent}if b is not None:',
+                          f'{indent}    b(pkt, m)'])
+        for child in node.children.values():
+            alpha = child.alpha
+            if alpha.act not in COMPARISONS:
+                continue
+            c = f'c{alpha.index}'
+            if c not in avail:
+                v = f'v{alpha.path_index}'
+                simple = alpha.act in ('y', 'n') or (alpha.act == '==' and type(alpha.val) in _LITERALS)
+                if v not in avail:
+                    source = field_source(alpha.pth)
+                    if alpha.path_index in self.scanners:
+                        namespace[f's{alpha.path_index}'] = self.scanners[alpha.path_index]
+                        source = f's{alpha.path_index}({source})'
+                    if simple and path_uses[alpha.path_index] == 1:
+                        v = f'({source})'
+                    else:
+                        lines.append(f'{indent}{v} = {source}')
+                        avail.add(v)
+                test = _source_test(alpha, v, namespace)
+                if alpha_uses[alpha.index] > 1:
+                    lines.append(f'{indent}{c} = {test}')
+                    avail.add(c)
+                else:
+                    c = test
+            lines.append(f'{indent}if {c}:')
+            self._emit(child, depth + 1, set(avail), lines, namespace, field_source, alpha_uses, path_uses, branches)
+
+
+# Types of constants that can be written into generated code as they are
+_LITERALS = (int, str, bytes, bool)
+
+# == children of one node on one path are put into a dict when there are at least this many
+INDEX_MIN_CHILDREN = 2
+
+# Operators that can be written into generated code as they are
+_NATIVE = ('==', '!=', '<=', '>=', '<', '>')
+
+
+# Returns python expression for a condition, v is the name of the field's value
+def _source_test(alpha, v, namespace):
+    if alpha.act == 'y':
+        return f'{v} is not None'
+    if alpha.act == 'n':
+        return f'{v} is None'
+    if alpha.act == 'contains_any':
+        # v is the set of alphas found by the path's automaton, see RuleNetwork.automata
+        return f'{alpha.index} in {v}'
+    if type(alpha.val) in _LITERALS:
+        c = repr(alpha.val)
+        if alpha.act == '==':
+            return f'{v} == {c}'
+    else:
+        c = f'k{alpha.index}'
+        namespace[c] = alpha.val
+    if alpha.act in _NATIVE:
+        return f'({v} is not None and {v} {alpha.act} {c})'
+    namespace[f't{alpha.index}'] = alpha.test
+    return f'bool(t{alpha.index}({v}, {c}))'
+
+
+# Operators that can be true when the field is absent
+_NONE_MATCHES = ('n',)
+
+
+# Identical conditions have equal keys, RuleNetwork merges them into one AlphaNode
+def condition_key(cond):
+    return cond.pth, cond.act, type(cond.val), _hashable(cond.val)
+
+
+# Rough relative costs of evaluating operators, used to order conditions
+CONDITION_COSTS = {'in': 1.5, 'not in': 1.5, 'in_cidr': 3, 'contains_any': 10}
+
+# Every ORDER_SAMPLE_EVERY-th packet is used to measure how often conditions pass
+ORDER_SAMPLE_EVERY = 16
+
+# Conditions are reordered every ORDER_REORDER_EVERY packets
+ORDER_REORDER_EVERY = 50000
+
+
+"""
+Orders conditions of rules by observed selectivity.
+On sampled packets every distinct condition of the network is evaluated, so pass rates don't depend on the current
+order. Periodically conditions of each rule are sorted by cost / (1 - pass rate), which puts cheap conditions that
+fail often first. The rank depends only on the condition, so conditions shared by several rules end up in the same
+order in all of them and still form shared prefixes in RuleNetwork. Conditions are only and-ed, so results don't change.
+Counts are halved after each reordering, so old traffic matters less over time
+"""
+class ConditionOrder:
+    def __init__(self, sample_every=ORDER_SAMPLE_EVERY, reorder_every=ORDER_REORDER_EVERY, debug=False):
+        self.sample_every = sample_every
+        self.reorder_every = reorder_every
+        self.debug = debug
+        self.seen = 0
+        # condition_key -> [tested, passed]
+        self.stats = {}
+
+    # Call for every packet. Returns True when rules were reordered and the network has to be rebuilt
+    def step(self, network, pkt):
+        self.seen += 1
+        if self.seen % self.sample_every == 0:
+            self.sample(network, pkt)
+        if self.seen % self.reorder_every == 0:
+            return self.reorder(network.rules)
+        return False
+
+    def sample(self, network, pkt):
+        values = [_UNSET] * len(network.paths)
+        stats = self.stats
+        for key, alpha in network.alphas.items():
+            v = values[alpha.path_index]
+            if v is _UNSET:
+                v = values[alpha.path_index] = alpha.get(pkt)
+            s = stats.get(key)
+            if s is None:
+                s = stats[key] = [0, 0]
+            s[0] += 1
+            if alpha.test(v, alpha.val):
+                s[1] += 1
+
+    # Conditions that were never tested pass half of the time
+    def pass_rate(self, cond):
+        tested, passed = self.stats.get(condition_key(cond), (0, 0))
+        return (passed + 1) / (tested + 2)
+
+    def rank(self, cond):
+        return CONDITION_COSTS.get(cond.act, 1) / (1 - self.pass_rate(cond)), repr(condition_key(cond))
+
+    def reorder(self, rules):
+        changed = False
+        for rule in rules:
+            conditions = sorted(rule.conditions, key=self.rank)
+            if conditions != rule.conditions:
+                rule.conditions = conditions
+                changed = True
+                if self.debug:
+                    order = ', '.join(f'{c.pth} {c.act} {c.val} ({self.pass_rate(c):.3f})' for c in conditions)
+                    print(f'Rule {rule.name} conditions reordered: {order}')
+        for s in self.stats.values():
+            s[0] //= 2
+            s[1] //= 2
+        return changed
+
+
+# Returns protocols that must be in a packet for the rule to match.
+# Only conditions on fields of known_protos are taken into account
+def required_protos(rule, known_protos):
+    need = set()
+    for cond in rule.conditions:
+        proto = cond.pth.split('.', 1)[0]
+        if proto in known_protos and cond.act not in _NONE_MATCHES:
+            need.add(proto)
+    return frozenset(need)
+
+
+# Values of conditions are used as dict keys, unhashable ones are keyed by their repr
+def _hashable(val):
+    try:
+        hash(val)
+        return val
+    except TypeError:
+        return repr(val)
+
+
+# Returns a field accessor for backends that store protocols as nested attributes
+def attr_accessor(pth, root=None):
+    get = attrgetter(pth)
+
+    def accessor(pkt):
+        try:
+            return get(pkt if root is None else getattr(pkt, root))
+        except AttributeError:
+            return None
+    return accessor
+
+
+# Returns python expression that walks the attributes of pth starting from root, used for compiled rules
+def attr_source(pth, root='pkt'):
+    for step in pth.split('.'):
+        root = f'getattr({root}, {step!r}, None)'
+    return root
+
+
+# Returns val of the condition converted with backend's decoders (pth -> function), see fields_values_decoder.
+# Every element of lists of set operators is converted separately
+def decode_value(cond, decoders):
+    if cond.act == 'in_cidr':
+        # Networks are given as 'a.b.c.d/n' strings and work with any representation of addresses, no decoding
+        return ipv4_networks([cond.val] if isinstance(cond.val, str) else cond.val)
+    decode = decoders.get(cond.pth, lambda a: a)
+    if cond.act in SET_OPERATORS:
+        return frozenset(decode(i) for i in cond.val)
+    if cond.act == 'contains_any':
+        # Patterns are matched against raw bytes of the field, strings are taken as utf-8
+        return frozenset(i.encode('utf-8') if isinstance(i, str) else bytes(i) for i in cond.val)
+    return decode(cond.val)
+
+
+"""
+Aho-Corasick automaton for matching many byte patterns at once.
+Each pattern has an owner, scan returns owners of all patterns found in the data after reading it a single time,
+however many patterns there are
+"""
+class AhoCorasick:
+    __slots__ = 'goto', 'fail', 'out'
+
+    # patterns are (bytes, owner) pairs
+    def __init__(self, patterns):
+        self.goto = [{}]
+        self.out = [set()]
+        for pattern, owner in patterns:
+            state = 0
+            for byte in pattern:
+                if byte not in self.goto[state]:
+                    self.goto[state][byte] = len(self.goto)
+                    self.goto.append({})
+                    self.out.append(set())
+                state = self.goto[state][byte]
+            self.out[state].add(owner)
+        # Breadth-first, so fail of every shorter state is known when it's needed
+        self.fail = [0] * len(self.goto)
+        queue = deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for byte, nxt in self.goto[state].items():
+                f = self.fail[state]
+                while f and byte not in self.goto[f]:
+                    f = self.fail[f]
+                self.fail[nxt] = self.goto[f].get(byte, 0)
+                self.out[nxt] |= self.out[self.fail[nxt]]
+                queue.append(nxt)
+
+    def search(self, data):
+        goto = self.goto
+        fail = self.fail
+        out = self.out
+        found = set(out[0])
+        state = 0
+        for byte in data:
+            while state and byte not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(byte, 0)
+            if out[state]:
+                found |= out[state]
+        return found
+
+    # Searches a field's value: bytes, utf-8 string or a list of them. Returns empty set for anything else
+    def scan(self, value):
+        if isinstance(value, bytes):
+            return self.search(value)
+        if isinstance(value, str):
+            return self.search(value.encode('utf-8'))
+        if isinstance(value, (list, tuple)):
+            found = set()
+            for i in value:
+                found |= self.scan(i)
+            return found
+        return set()
+
+
+def seconds_to_ns(seconds):
+    # Goes through str so that values like 0.1 from json are converted exactly
+    return int(Decimal(str(seconds)) * NS_PER_SECOND)
+
+
+# pcap magic number -> nanoseconds per tick of the fractional timestamp field
+PCAP_MAGIC = {0xa1b2c3d4: 1000, 0xa1b23c4d: 1}
+# magic, version major, version minor, thiszone, sigfigs, snaplen, linktype
+PCAP_HEADER = 'IHHiIII'
+
+
 class Session:
+    # Reads pcap records directly so that timestamps stay integer nanoseconds for both
+    # microsecond and nanosecond captures instead of going through float or Decimal
     def __init__(self, path):
-        self.pcap = dpkt.pcap.Reader(open(path, 'rb'))
-        self.ll_type = self.pcap.datalink()
+        self.file = open(path, 'rb')
+        header = self.file.read(24)
+        for order in '<>':
+            magic, *_, self.ll_type = Struct(order + PCAP_HEADER).unpack(header)
+            if magic in PCAP_MAGIC:
+                break
+        else:
+            raise ValueError(f'{path} is not a pcap file')
+        self.tick = PCAP_MAGIC[magic]
+        self.record = Struct(order + 'IIII')
         self.__iter = iter(self)
 
     def __next__(self):
         return next(self.__iter)
 
     def __iter__(self):
-        for i in self.pcap:
-            yield self.ll_type, *i
+        read = self.file.read
+        unpack = self.record.unpack
+        size = self.record.size
+        ll_type = self.ll_type
+        tick = self.tick
+        while len(header := read(size)) == size:
+            sec, frac, caplen, _ = unpack(header)
+            yield ll_type, sec * NS_PER_SECOND + frac * tick, read(caplen)
 
 
 def flatten_tuple(r, t, name):
@@ -110,6 +785,14 @@ def flatten_tuple(r, t, name):
     return r
 
 
+# Copies length bytes at offset out of data. Replaces unpack with a per-call f'{length}s' format,
+# which makes struct parse and cache a new format for every distinct length
+def read_bytes(data, offset: int, length: int) -> bytes:
+    if offset + length > len(data):
+        raise error(f'read_bytes requires a buffer of at least {offset + length} bytes, got {len(data)}')
+    return bytes(data[offset:offset + length])
+
+
 def construct_msg(cmd, obj):
     obj = pickle.dumps(obj)
     x = len(obj)
@@ -120,12 +803,12 @@ def construct_msg(cmd, obj):
 
 """
 Used to specify ipv4 addresses as networks, with low and high addresses
-Currently unused because isn't finished
-Plans: override __eq__ method to check if other is a single address and if it's fits into network
-Maybe check built-in first???
+`addr in network` checks if a single address fits into the network, address can be int, 4 bytes or string
 """
 class ipv4_address:
-    def __init__(self, addr, mask):
+    __slots__ = 'low', 'high'
+
+    def __init__(self, addr, mask=4294967295):
         if not isinstance(addr, int):
             addr = ipv4_to_int(addr)
         if not isinstance(mask, int):
@@ -133,12 +816,68 @@ class ipv4_address:
         self.low = addr & mask
         self.high = addr | (4294967295 - mask)
 
+    # Expects '255.255.255.255/32', address without mask is a single host
     @classmethod
     def from_collapsed_mask(cls, s):
         s = s.split('/')
-        mask = int('0b' + '1' * (n := int(s[1])) + '0' * (32 - n), 2)
+        mask = int('0b' + '1' * (n := int(s[1]) if len(s) > 1 else 32) + '0' * (32 - n), 2)
         return cls(s[0], mask)
 
+    def __contains__(self, addr):
+        addr = ipv4_as_int(addr)
+        return addr is not None and self.low <= addr <= self.high
+
+    def __repr__(self):
+        return f'{int_to_ipv4(self.low)}-{int_to_ipv4(self.high)}'
+
+
+"""
+Set of ipv4 networks, used as val of in_cidr conditions.
+Networks are sorted and overlapping or adjacent ones are merged into [low, high] intervals,
+so an address is looked up with bisect in O(log n) however many prefixes there are
+"""
+class ipv4_networks:
+    __slots__ = 'lows', 'highs'
+
+    def __init__(self, networks):
+        networks = [i if isinstance(i, ipv4_address) else ipv4_address.from_collapsed_mask(i) for i in networks]
+        self.lows = []
+        self.highs = []
+        for low, high in sorted((i.low, i.high) for i in networks):
+            if self.highs and low <= self.highs[-1] + 1:
+                self.highs[-1] = max(self.highs[-1], high)
+            else:
+                self.lows.append(low)
+                self.highs.append(high)
+
+    def __contains__(self, addr):
+        addr = ipv4_as_int(addr)
+        if addr is None:
+            return False
+        i = bisect_right(self.lows, addr) - 1
+        return i >= 0 and addr <= self.highs[i]
+
+    # Equal sets are merged into one condition by RuleNetwork
+    def __eq__(self, other):
+        return isinstance(other, ipv4_networks) and self.lows == other.lows and self.highs == other.highs
+
+    def __hash__(self):
+        return hash((tuple(self.lows), tuple(self.highs)))
+
+    def __repr__(self):
+        return ', '.join(f'{int_to_ipv4(low)}-{int_to_ipv4(high)}' for low, high in zip(self.lows, self.highs))
+
+
+# Turns ipv4 in any of the representations used by backends into int, returns None for anything else
+def ipv4_as_int(addr):
+    if isinstance(addr, int):
+        return addr
+    if isinstance(addr, bytes) and len(addr) == 4:
+        return int.from_bytes(addr, 'big')
+    if isinstance(addr, str) and is_ipv4(addr):
+        return ipv4_to_int(addr)
+    return None
+
 
 # Turns string ipv4 into int. Expects input to have format: '255.255.255.255'
 def ipv4_to_int(s: str) -> int:
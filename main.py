@@ -7,13 +7,17 @@ import creator
 
 import json
 from extensions import Rule
+from rule_manager import RuleManager
+from action_queue import ActionQueue
 
 if __name__ == "__main__":
-    with open('rules.json') as f:
-        rules = [Rule(i) for i in json.load(f)]
+    manager = RuleManager('rules.json')
+    queue = ActionQueue()
 
     path = 'C:/Users/plox/Desktop/1.pcap'
-    dict_p.do(path, rules)
+    dict_p.do(path, manager.rules, manager=manager, queue=queue)
+    queue.close()
+    print(queue.report())
 '''
     dpath = 'C:/Users/plox/scratch/dumps'
     report = [False] * 5
@@ -0,0 +1,382 @@
+import timeit
+from datetime import datetime
+from itertools import islice
+
+import numpy as np
+
+import dict_p
+from dict_p.network_protocols import PROTOS_CONSTRUCTOR
+from extensions import NS_PER_SECOND, COMPARISONS, SET_OPERATORS, Session, condition_key, decode_value
+
+"""
+Columnar parsing of frames in batches. The fixed-offset headers (radiotap base fields and FCS flag, dot11 frame
+control, duration, addresses and sequence control) of a whole batch are decoded at once into a NumPy structured
+array, one column per dict_p field path. Everything past them has variable layout and is parsed per row by dict_p,
+see Batch.packet. Values equal what dict_p stores for the same field, except MAC addresses, which are big-endian ints
+"""
+
+# Bytes of every frame copied into the batch. Rows whose dot11 header doesn't fit in them are decoded by dict_p
+SNAP = 128
+BATCH_SIZE = 4096
+
+_RADIOTAP = 127
+_DOT11 = 105
+# dot11 header bytes read for every row: frame control, duration and up to four addresses with sequence control
+_DOT11_SIZE = 30
+_MAC = ('receiver', 'transmitter', 'destination', 'source', 'bssid', 'sta_address')
+_FRAME_CONTROL = ('subtype', 'type', 'version', 'to_ds', 'from_ds', 'more_fragments', 'retry', 'pwr_mgt',
+                  'more_data', 'protected', 'order')
+
+# Layer columns tell whether the protocol is in Packet.protos, the rest hold field values
+COLUMNS = np.dtype([('ll_type', 'u2'),
+                    ('time', 'i8'),
+                    ('radiotap', '?'),
+                    ('radiotap.version', 'u1'),
+                    ('radiotap.pad', 'u1'),
+                    ('radiotap.length', 'u2'),
+                    ('radiotap.present', 'u4'),
+                    ('radiotap.flags.fcs_at_end', 'u1'),
+                    ('dot11_header', '?'),
+                    *((f'dot11_header.frame_control.{name}', 'u1') for name in _FRAME_CONTROL),
+                    ('dot11_header.type_subtype', 'u1'),
+                    ('dot11_header.ds', 'u1'),
+                    ('dot11_header.duration', 'u2'),
+                    ('dot11_header.sequence_number', 'u2'),
+                    ('dot11_header.fragment_number', 'u1'),
+                    *((f'dot11_header.{name}', 'u8') for name in _MAC)])
+# Set where the field has a value, dict_p has None or no field at all elsewhere
+VALID = np.dtype([(name, '?') for name in COLUMNS.names])
+_LAYERS = ('ll_type', 'time', 'radiotap', 'dot11_header')
+
+
+class Batch:
+    __slots__ = 'frames', 'columns', 'valid', 'packets'
+
+    # frames are (ll_type, time, data) as Session yields them
+    def __init__(self, frames: list, snap: int = SNAP):
+        self.frames = frames
+        # Rows parsed by dict_p, so rules and actions that need the same row share the work
+        self.packets = {}
+        self.columns = np.zeros(len(frames), COLUMNS)
+        self.valid = np.zeros(len(frames), VALID)
+        if frames:
+            self.decode(snap)
+
+    def __len__(self):
+        return len(self.frames)
+
+    # Field values with the rows that have none masked out
+    def column(self, pth: str) -> np.ma.MaskedArray:
+        return np.ma.MaskedArray(self.columns[pth], ~self.valid[pth])
+
+    # Parses the row with dict_p, for the layers that have no columns. Fully parsed rows are kept
+    def packet(self, i: int) -> dict_p.Packet:
+        if (pkt := self.packets.get(i)) is None:
+            pkt = self.packets[i] = dict_p.Packet(self.frames[i])
+        return pkt
+
+    def decode(self, snap: int):
+        n = len(self.frames)
+        c = self.columns
+        v = self.valid
+        rows = np.arange(n)
+        ll_type = np.fromiter((pkt[0] for pkt in self.frames), np.uint16, n)
+        size = np.fromiter((len(pkt[2]) for pkt in self.frames), np.int64, n)
+        c['ll_type'] = ll_type
+        c['time'] = np.fromiter((pkt[1] for pkt in self.frames), np.int64, n)
+        for name in _LAYERS:
+            v[name] = True
+        raw = np.frombuffer(b''.join(pkt[2][:snap].ljust(snap, b'\0') for pkt in self.frames),
+                            np.uint8).reshape(n, snap).astype(np.int64)
+
+        # Radiotap, little-endian
+        rt = ll_type == _RADIOTAP
+        c['radiotap'] = rt
+        base = rt & (size >= 8)
+        length = raw[:, 2] | raw[:, 3] << 8
+        present = raw[:, 4] | raw[:, 5] << 8 | raw[:, 6] << 16 | raw[:, 7] << 24
+        for name, value in (('version', raw[:, 0]), ('pad', raw[:, 1]), ('length', length), ('present', present)):
+            c[f'radiotap.{name}'] = value
+            v[f'radiotap.{name}'] = base
+        header = base & (size >= length)
+
+        # Walks extended present words to where the fields start. Rows whose bitmap runs past the copied bytes
+        # are left to dict_p, the ones where it runs past the header are malformed
+        last = np.full(n, 8)
+        word = present.copy()
+        fallback = np.zeros(n, bool)
+        more = header & (word >> 31 == 1)
+        while more.any():
+            header &= ~more | (last + 4 <= length)
+            fallback |= more & header & (last + 4 > snap)
+            more &= header & ~fallback
+            at = np.minimum(last, snap - 4)
+            word = np.where(more, raw[rows, at] | raw[rows, at + 1] << 8 | raw[rows, at + 2] << 16
+                            | raw[rows, at + 3] << 24, word)
+            last += more * 4
+            more &= word >> 31 == 1
+
+        # Flags follow TSFT, the only field before them, which is aligned to 8 bytes
+        flags = last + (present & 1) * (-last % 8 + 8)
+        located = header & (present >> 1 & 1 == 1) & (flags < length)
+        fallback |= located & (flags >= snap)
+        fcs = np.where(located, raw[rows, np.minimum(flags, snap - 1)] >> 4 & 1, 0)
+        c['radiotap.flags.fcs_at_end'] = fcs
+        v['radiotap.flags.fcs_at_end'] = located
+
+        # dot11 header, it follows radiotap or starts the frame
+        dot11 = ll_type == _DOT11
+        c['dot11_header'] = dot11 | header
+        start = np.where(rt, length, 0)
+        end = size - fcs * 4
+        fallback |= (dot11 | header) & (start + _DOT11_SIZE > snap)
+        h = raw[rows[:, None], np.minimum(start[:, None] + np.arange(_DOT11_SIZE), snap - 1)]
+        available = end - start
+        fixed = (dot11 | header) & (available >= 10)
+
+        fc0 = h[:, 0]
+        fc1 = h[:, 1]
+        fc = dict(zip(_FRAME_CONTROL, (fc0 >> 4, fc0 >> 2 & 3, fc0 & 3, fc1 & 1, fc1 >> 1 & 1, fc1 >> 2 & 1,
+                                       fc1 >> 3 & 1, fc1 >> 4 & 1, fc1 >> 5 & 1, fc1 >> 6 & 1, fc1 >> 7)))
+        type_subtype = fc['type'] << 4 | fc['subtype']
+        ds = fc['from_ds'] << 1 | fc['to_ds']
+        for name, value in fc.items():
+            c[f'dot11_header.frame_control.{name}'] = value
+            v[f'dot11_header.frame_control.{name}'] = fixed
+        # dict_p reads duration and sequence control in network order
+        for name, value in (('type_subtype', type_subtype), ('ds', ds), ('duration', h[:, 2] << 8 | h[:, 3])):
+            c[f'dot11_header.{name}'] = value
+            v[f'dot11_header.{name}'] = fixed
+
+        # Layout of the addresses depends on the frame, same as in dict_p's dot11_header
+        short = np.isin(type_subtype, (28, 29, 30))
+        two = np.isin(type_subtype, (24, 26, 27))
+        full = fixed & ~short & ~two & (available >= 24)
+        seq = h[:, 22] << 8 | h[:, 23]
+        c['dot11_header.sequence_number'] = seq >> 4
+        c['dot11_header.fragment_number'] = seq & 15
+        v['dot11_header.sequence_number'] = v['dot11_header.fragment_number'] = full
+
+        addresses = [(_mac(h, k), valid) for k, valid in ((4, fixed),
+                                                          (10, full | fixed & two & (available >= 16)),
+                                                          (16, full),
+                                                          (24, full & (ds == 3)))]
+        none = (np.zeros(n, np.uint64), np.zeros(n, bool))
+        receiver, transmitter, third, fourth = addresses
+        for name, by_ds in (('receiver', (receiver,) * 4),
+                            ('transmitter', (transmitter,) * 4),
+                            ('destination', (receiver, third, receiver, third)),
+                            ('source', (transmitter, transmitter, third, fourth)),
+                            ('bssid', (third, receiver, transmitter, none)),
+                            ('sta_address', (none, transmitter, receiver, none))):
+            pick = [ds == i for i in range(4)]
+            c[f'dot11_header.{name}'] = np.select(pick, [value for value, _ in by_ds])
+            v[f'dot11_header.{name}'] = np.select(pick, [valid for _, valid in by_ds]) & fixed
+
+        for i in np.flatnonzero(fallback):
+            self.fill(i)
+
+    # Sets the columns of row i from its dict_p fields
+    def fill(self, i: int):
+        c = self.columns[i]
+        v = self.valid[i]
+        fields = [name for name in COLUMNS.names if name not in _LAYERS]
+        for name in fields:
+            v[name] = False
+        try:
+            pkt = self.packet(i)
+        except Exception:
+            # Some frames break dict_p, they only have layer columns then
+            return
+        for name in _LAYERS[2:]:
+            c[name] = name in pkt.protos
+        for name in fields:
+            if (value := pkt.fields.get(name)) is not None:
+                c[name] = int.from_bytes(value, 'big') if isinstance(value, bytes) else value
+                v[name] = True
+
+
+# A row of a batch in place of a packet, for Rule.add, its group_by key and its actions
+class Row:
+    __slots__ = 'batch', 'index', 'time'
+
+    def __init__(self, batch: Batch, index: int):
+        self.batch = batch
+        self.index = index
+        self.time = int(batch.columns['time'][index])
+
+    # Same value as dict_p's field_accessor gives for the packet
+    def get(self, pth, default=None):
+        batch = self.batch
+        i = self.index
+        if pth in _LAYER_COLUMNS:
+            return True if batch.columns[pth][i] else default
+        if pth in _FIELD_COLUMNS:
+            if not batch.valid[pth][i]:
+                return default
+            value = int(batch.columns[pth][i])
+            return value.to_bytes(6, 'big') if COLUMNS[pth] == _MAC_COLUMN else value
+        pkt = batch.packet(i)
+        if pth in PROTOS_CONSTRUCTOR:
+            return True if pth in pkt.protos else default
+        return pkt.fields.get(pth, default)
+
+    def get_time(self):
+        return datetime.fromtimestamp(self.time / NS_PER_SECOND)
+
+    def summary(self) -> str:
+        return self.batch.packet(self.index).summary()
+
+    # The batch is reused by the loop, the ActionQueue worker gets the row as a dict_p packet of its own
+    def freeze(self):
+        if (pkt := self.batch.packets.get(self.index)) is not None:
+            return pkt.freeze()
+        return dict_p.unparsed(self.batch.frames[self.index])
+
+
+_LAYER_COLUMNS = _LAYERS[2:]
+_FIELD_COLUMNS = frozenset(COLUMNS.names) - frozenset(_LAYERS)
+_MAC_COLUMN = np.dtype('u8')
+
+
+"""
+Evaluates rules on whole batches. Every distinct condition on a column becomes one boolean mask per batch: comparisons
+are done on the column where it's valid, y and n are the validity itself. Conditions on other fields, and those whose
+value can't be compared with a column, are evaluated per row with COMPARISONS, only on rows that passed the column
+conditions of the rule. Matched rows are handed to Rule.add in packet order, so windows, cooldowns and counters
+end up the same as with the per-packet loop
+"""
+class BatchMatcher:
+    def __init__(self, rules):
+        self.rules = rules
+        # condition_key -> index of the condition, identical conditions are evaluated once per batch
+        keys = {}
+        self.conditions = []
+        # (column conditions, row conditions) of every rule, as indexes
+        self.plans = []
+        for rule in rules:
+            plan = ([], [])
+            for cond in rule.conditions:
+                key = condition_key(cond)
+                if key not in keys:
+                    keys[key] = len(self.conditions)
+                    self.conditions.append((cond, _vectorize(cond)))
+                index = keys[key]
+                plan[self.conditions[index][1] is None].append(index)
+            self.plans.append(plan)
+
+    # Rules by rows, rule i matched row j if masks[i, j]
+    def masks(self, batch: Batch) -> np.ndarray:
+        masks = np.ones((len(self.rules), len(batch)), bool)
+        done = {}
+        rows = {}
+        for mask, (columns, per_row) in zip(masks, self.plans):
+            for index in columns:
+                if (m := done.get(index)) is None:
+                    m = done[index] = self.conditions[index][1](batch)
+                mask &= m
+            for index in per_row:
+                cond, _ = self.conditions[index]
+                test = COMPARISONS.get(cond.act, lambda a, b: False)
+                results = rows.setdefault(index, {})
+                for i in np.flatnonzero(mask).tolist():
+                    if (passed := results.get(i)) is None:
+                        passed = results[i] = test(Row(batch, i).get(cond.pth), cond.val)
+                    if not passed:
+                        mask[i] = False
+        return masks
+
+    # Yields (row, rule) of every match, ordered by rows
+    def match(self, batch: Batch):
+        rules = self.rules
+        row = None
+        for i, r in zip(*(a.tolist() for a in np.nonzero(self.masks(batch).T))):
+            if row is None or row.index != i:
+                row = Row(batch, i)
+            yield row, rules[r]
+
+
+# Returns the condition as a function of a batch that gives its mask, or None if it's evaluated per row
+def _vectorize(cond):
+    if cond.pth not in _FIELD_COLUMNS and cond.pth not in _LAYER_COLUMNS:
+        return None
+    act = cond.act
+    if cond.pth in _LAYER_COLUMNS:
+        # Layers are True when present and None otherwise, like dict_p's field_accessor gives them
+        def source(batch):
+            return batch.columns[cond.pth], batch.columns[cond.pth]
+    else:
+        def source(batch):
+            return batch.columns[cond.pth], batch.valid[cond.pth]
+
+    if act == 'y':
+        return lambda batch: source(batch)[1].copy()
+    if act == 'n':
+        return lambda batch: ~source(batch)[1]
+    mac = cond.pth in _FIELD_COLUMNS and COLUMNS[cond.pth] == _MAC_COLUMN
+    if act in SET_OPERATORS:
+        values = [_operand(val, mac) for val in cond.val]
+        if any(val is None for val in values):
+            return None
+        invert = act == 'not in'
+        return lambda batch: _masked(source(batch), lambda column: np.isin(column, values, invert=invert))
+    if act in _ORDERED:
+        if (val := _operand(cond.val, mac)) is None:
+            return None
+        op = _ORDERED[act]
+        return lambda batch: _masked(source(batch), lambda column: op(column, val))
+    return None
+
+
+_ORDERED = {'==': np.equal, '!=': np.not_equal, '<=': np.less_equal, '>=': np.greater_equal, '<': np.less,
+            '>': np.greater}
+
+
+# Value of a rule in the form of a column. None if it's something a column can't be compared with
+def _operand(val, mac: bool):
+    if mac:
+        # dict_p keeps addresses as bytes and compares them with bytes
+        return int.from_bytes(val, 'big') if isinstance(val, bytes) and len(val) == 6 else None
+    return val if isinstance(val, (bool, int, float)) else None
+
+
+def _masked(source, test) -> np.ndarray:
+    column, valid = source
+    return test(column) & valid
+
+
+# Converts values of the rule into the form dict_p produces, rows give values in that form too
+def prepare_rule(rule, queue=None):
+    for cond in rule.conditions:
+        cond.val = decode_value(cond, dict_p.fields_values_decoder)
+    rule.bind(field_accessor, queue)
+
+
+def field_accessor(pth):
+    return lambda row: row.get(pth)
+
+
+# Same as dict_p.do, but frames are read and matched in batches of size
+def do(path, rules, size: int = BATCH_SIZE, queue=None):
+    for rule in rules:
+        prepare_rule(rule, queue)
+    matcher = BatchMatcher(rules)
+    start = timeit.default_timer()
+    for batch in batches(path, size):
+        for row, rule in matcher.match(batch):
+            rule.add(row)
+    return timeit.default_timer() - start
+
+
+# Reads the capture as batches of at most size frames
+def batches(path, size: int = BATCH_SIZE, snap: int = SNAP):
+    frames = iter(Session(path))
+    while batch := list(islice(frames, size)):
+        yield Batch(batch, snap)
+
+
+def _mac(h: np.ndarray, k: int) -> np.ndarray:
+    value = np.zeros(len(h), np.uint64)
+    for j in range(6):
+        value = value << np.uint64(8) | h[:, k + j].astype(np.uint64)
+    return value
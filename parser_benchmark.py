@@ -0,0 +1,79 @@
+import os
+import sys
+from contextlib import redirect_stdout
+from time import perf_counter_ns
+
+import custom_p
+import dict_p
+import slots_classes_p
+from dict_p.network_protocols import PROTOS_CONSTRUCTOR, LL_TYPES
+from extensions import Session
+
+TERMINAL = ('MALFORMED', 'TO_DECRYPT', 'UNKNOWN')
+
+
+# Splits every frame of the capture into the (data, offset, *extra) inputs each dict_p parser receives.
+# Inputs a parser raised on are left out of its timings and counted in errors
+def collect(path, limit):
+    frames = []
+    layers = {}
+    errors = {}
+    for pkt in Session(path):
+        if len(frames) == limit:
+            break
+        frames.append(pkt)
+        payload = (LL_TYPES[pkt[0]], memoryview(pkt[2]), 0)
+        while payload:
+            proto, *args = payload
+            try:
+                _, payload = PROTOS_CONSTRUCTOR[proto](*args)
+            except Exception:
+                errors[proto] = errors.get(proto, 0) + 1
+                break
+            layers.setdefault(proto, []).append(args)
+            if payload[0] in TERMINAL:
+                payload = None
+    return frames, layers, errors
+
+
+# Returns the best of `rounds` passes over inputs in nanoseconds per call and the number of inputs func raised on.
+# A call that raises stops early, so timings of a func with failures aren't comparable with the others
+def measure(func, inputs, rounds):
+    best = None
+    failed = 0
+    for _ in range(rounds):
+        failed = 0
+        start = perf_counter_ns()
+        for args in inputs:
+            try:
+                func(*args)
+            except Exception:
+                failed += 1
+        elapsed = perf_counter_ns() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best / len(inputs), failed
+
+
+def run(path, limit=20000, rounds=5):
+    # Parsers print warnings for odd frames, which would otherwise dominate the timings
+    with open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        frames, layers, errors = collect(path, limit)
+        protos = {proto: measure(PROTOS_CONSTRUCTOR[proto], inputs, rounds) for proto, inputs in layers.items()}
+        inputs = [(pkt,) for pkt in frames]
+        backends = {name: measure(func, inputs, rounds)
+                    for name, func in (('dict_p', dict_p.Packet),
+                                       ('custom_p', lambda pkt: custom_p.Packet.from_raw(*pkt)),
+                                       ('slots_classes_p', lambda pkt: slots_classes_p.Packet.from_raw(*pkt)))}
+
+    print(f'{"dict_p protocol":<24}{"calls":>8}{"ns/call":>12}{"failed":>8}')
+    for proto in sorted(protos.keys() | errors.keys()):
+        ns, failed = protos.get(proto, (0, 0))
+        print(f'{proto:<24}{len(layers.get(proto, ())):>8}{ns:>12.0f}{failed + errors.get(proto, 0):>8}')
+
+    print(f'\n{"whole frame":<24}{"frames":>8}{"ns/frame":>12}{"failed":>8}')
+    for name, (ns, failed) in backends.items():
+        print(f'{name:<24}{len(frames):>8}{ns:>12.0f}{failed:>8}')
+
+
+if __name__ == "__main__":
+    run(sys.argv[1], *map(int, sys.argv[2:]))
@@ -0,0 +1,317 @@
+from extensions import COMPARISONS, SET_OPERATORS
+
+
+"""
+Raw-byte prefilter compiled from rules, in the spirit of BPF.
+Conditions on fields that sit at fixed offsets from the start of the 802.11 header (or of the ethernet frame) are
+compiled into a small program of loads, masks, compares and jumps that runs on the raw frame before it's parsed.
+A frame the program rejects provably matches no rule, so it doesn't need to be parsed at all.
+Every condition but 'n' needs its field, so it needs the layer too: conditions on a layer reached only through
+fixed-offset headers (llc in data frames, arp, ipv4, 802.1X) also check the frame type and ethertype on the way there.
+Conditions the compiler doesn't know are taken as passing, so a rule is ruled out only when a compiled condition fails.
+Fields are in the form dict_p gives them, conditions must already be prepared by the backend (see prepare_rule).
+If frames are decrypted while parsed, protected data frames carry llc too, conditions past the 802.11 header then
+can't be checked on raw bytes. The decryptor also needs every EAPOL frame for its keys, so those are always accepted
+"""
+
+# Instructions are tuples, jump targets are indexes into the program:
+# ('ld', size, k, jf)   A = big-endian size bytes at X + k, goes to jf if the frame is shorter
+# ('and', k)            A &= k
+# ('jeq', k, jt, jf)    goes to jt if A == k else to jf, jgt and jge test A > k and A >= k
+# ('ja', k)             goes to k
+# ('ret', v)            ends with v, True if the frame has to be parsed
+LD, AND, JEQ, JGT, JGE, JA, RET = 'ld', 'and', 'jeq', 'jgt', 'jge', 'ja', 'ret'
+
+ACCEPT = [(RET, True)]
+
+# Link type -> layout of its frames, X is the offset of the first header the programs read
+_RADIOTAP = 127
+LL_KINDS = {127: 'dot11', 105: 'dot11', 1: 'ethernet'}
+
+# (size, offset, mask, operator, value). Offsets are counted from X
+_TYPE = (1, 0, 0x0c)
+_TYPE_SUBTYPE = (1, 0, 0xfc)
+_PROTECTED = (1, 1, 0x40)
+_DS = (1, 1, 0x03)
+
+# Data frames carry llc in four layouts: plain or QoS data, with three or four addresses.
+# (tests, offset of llc). QoS data carries llc only if the A-MSDU bit of QoS control is clear
+_LLC = [([(*_TYPE_SUBTYPE, '==', 0x08), (*_PROTECTED, '==', 0), (*_DS, '!=', 3)], 24),
+        ([(*_TYPE_SUBTYPE, '==', 0x08), (*_PROTECTED, '==', 0), (*_DS, '==', 3)], 30),
+        ([(*_TYPE_SUBTYPE, '==', 0x88), (*_PROTECTED, '==', 0), (*_DS, '!=', 3), (1, 24, 0x80, '==', 0)], 26),
+        ([(*_TYPE_SUBTYPE, '==', 0x88), (*_PROTECTED, '==', 0), (*_DS, '==', 3), (1, 30, 0x80, '==', 0)], 32)]
+
+# Protocol -> (parent, test on the parent's header that leads to it, size of the parent's header)
+_CHAIN = {'arp': ('llc', (2, 6, None, '==', 0x0806), 8),
+          'ipv4': ('llc', (2, 6, None, '==', 0x0800), 8),
+          'dot1x_authentication': ('llc', (2, 6, None, '==', 0x888e), 8),
+          'udp': ('ipv4', (1, 9, None, '==', 17), None),
+          'dhcp': ('udp', None, None),
+          'eap': ('dot1x_authentication', (1, 1, None, '==', 0), None)}
+_ETHERNET_CHAIN = {'arp': ('ethernet', (2, 12, None, '==', 0x0806), 14),
+                   'ipv4': ('ethernet', (2, 12, None, '==', 0x0800), 14),
+                   'dot1x_authentication': ('ethernet', (2, 12, None, '==', 0x888e), 14)}
+
+# Field -> (size, offset from the start of its protocol's header, mask). Values of masked fields are shifted to
+# the lowest set bit of the mask
+FIELDS = {'dot11_header.frame_control.subtype': (1, 0, 0xf0),
+          'dot11_header.frame_control.type': _TYPE,
+          'dot11_header.frame_control.version': (1, 0, 0x03),
+          'dot11_header.frame_control.to_ds': (1, 1, 0x01),
+          'dot11_header.frame_control.from_ds': (1, 1, 0x02),
+          'dot11_header.frame_control.more_fragments': (1, 1, 0x04),
+          'dot11_header.frame_control.retry': (1, 1, 0x08),
+          'dot11_header.frame_control.pwr_mgt': (1, 1, 0x10),
+          'dot11_header.frame_control.more_data': (1, 1, 0x20),
+          'dot11_header.frame_control.protected': _PROTECTED,
+          'dot11_header.frame_control.order': (1, 1, 0x80),
+          'dot11_header.ds': _DS,
+          # dict_p reads it in network order
+          'dot11_header.duration': (2, 2, None),
+          'llc.dsap': (1, 0, None),
+          'llc.ssap': (1, 1, None),
+          'llc.control_field': (1, 2, None),
+          'llc.type': (2, 6, None),
+          'ethernet.length': (2, 12, None),
+          'arp.hardware_type': (2, 0, None),
+          'arp.protocol_type': (2, 2, None),
+          'arp.hardware_size': (1, 4, None),
+          'arp.protocol_size': (1, 5, None),
+          'arp.opcode': (2, 6, None),
+          'arp.sender_ip': (4, 14, None),
+          'arp.target_ip': (4, 24, None),
+          'ipv4.version': (1, 0, 0xf0),
+          'ipv4.ihl': (1, 0, 0x0f),
+          'ipv4.dscp': (1, 1, 0xfc),
+          'ipv4.ecn': (1, 1, 0x03),
+          'ipv4.total_length': (2, 2, None),
+          'ipv4.identification': (2, 4, None),
+          'ipv4.flags': (2, 6, 0xe000),
+          'ipv4.fragment_offset': (2, 6, 0x1fff),
+          'ipv4.ttl': (1, 8, None),
+          'ipv4.protocol': (1, 9, None),
+          'ipv4.header_checksum': (2, 10, None),
+          'ipv4.source': (4, 12, None),
+          'ipv4.destination': (4, 16, None),
+          'dot1x_authentication.version': (1, 0, None),
+          'dot1x_authentication.type': (1, 1, None),
+          'dot1x_authentication.length': (2, 2, None)}
+
+_OPERATORS = ('==', '!=', '<', '<=', '>', '>=', *SET_OPERATORS)
+
+
+class Prefilter:
+    __slots__ = 'programs'
+
+    def __init__(self, rules, decrypted=False):
+        self.programs = {kind: compile_rules(rules, kind, decrypted) for kind in set(LL_KINDS.values())}
+
+    # Takes (ll_type, time, data) as Session yields them, False if no rule can match the frame
+    def __call__(self, pkt) -> bool:
+        ll_type, _, data = pkt
+        kind = LL_KINDS.get(ll_type)
+        if kind is None:
+            return True
+        x = 0
+        if ll_type == _RADIOTAP:
+            # Loads past a radiotap header that doesn't fit in the frame fail, and so do the tests
+            x = data[2] | data[3] << 8 if len(data) >= 4 else len(data)
+        return run(self.programs[kind], data, x)
+
+    # True if no frame can be rejected, using the prefilter is pointless then
+    def accepts_all(self) -> bool:
+        return all(program is ACCEPT for program in self.programs.values())
+
+    def listing(self) -> str:
+        return '\n'.join(f'{kind}:\n' + '\n'.join(f'{i:4} {ins}' for i, ins in enumerate(program))
+                         for kind, program in self.programs.items())
+
+
+def run(program: list, data: bytes, x: int) -> bool:
+    a = 0
+    pc = 0
+    size = len(data)
+    while True:
+        ins = program[pc]
+        op = ins[0]
+        if op == LD:
+            start = x + ins[2]
+            end = start + ins[1]
+            if end > size:
+                pc = ins[3]
+                continue
+            a = data[start] if ins[1] == 1 else int.from_bytes(data[start:end], 'big')
+            pc += 1
+        elif op == AND:
+            a &= ins[1]
+            pc += 1
+        elif op == JEQ:
+            pc = ins[2] if a == ins[1] else ins[3]
+        elif op == JGT:
+            pc = ins[2] if a > ins[1] else ins[3]
+        elif op == JGE:
+            pc = ins[2] if a >= ins[1] else ins[3]
+        elif op == JA:
+            pc = ins[1]
+        else:
+            return ins[1]
+
+
+# Returns the program for frames of the kind (see LL_KINDS). It accepts frames that pass every compiled condition
+# of at least one rule
+def compile_rules(rules, kind: str, decrypted=False) -> list:
+    alternatives = set()
+    for rule in rules:
+        for alternative in _rule_alternatives(rule, kind, decrypted):
+            if not alternative:
+                # Nothing about the rule can be checked before parsing
+                return ACCEPT
+            alternatives.add(alternative)
+    if decrypted:
+        # Keys come from the handshakes, a rule on decrypted frames matches nothing if they're filtered out
+        alternatives.update(_in_frame_order(tests) for _, tests, _ in _locations('dot1x_authentication', kind))
+
+    # A block per alternative, a failed test jumps to the next block
+    program = []
+    for alternative in sorted(alternatives, key=repr):
+        start = len(program)
+        loaded = None
+        for test in alternative:
+            # A passed test leaves A as it was loaded
+            _emit(program, *test, load=test[:3] != loaded)
+            loaded = test[:3]
+        program.append((RET, True))
+        program[start:] = [tuple(len(program) if t is _FAIL else t for t in ins) for ins in program[start:]]
+    program.append((RET, False))
+    return program
+
+
+# Conjunctions of (size, offset, mask, operator, value) tests, one of which every frame the rule matches passes
+def _rule_alternatives(rule, kind: str, decrypted=False) -> list:
+    # (case of the llc layout, tests), None matches every case
+    alternatives = [(None, ())]
+    for cond in rule.conditions:
+        options = _condition_alternatives(cond, kind, decrypted)
+        if options is None:
+            continue
+        alternatives = [(case if other is None else other, tests + more)
+                        for case, tests in alternatives for other, more in options
+                        if case is None or other is None or case == other]
+    return [_in_frame_order(tests) for _, tests in alternatives]
+
+
+# Tests go in frame order, so the ones on the same bytes follow each other and share the load
+def _in_frame_order(tests) -> tuple:
+    return tuple(sorted(set(tests), key=lambda t: (t[1], t[0], repr(t[2:]))))
+
+
+# Returns [(case, tests)] for the condition or None if it can't be checked on raw bytes
+def _condition_alternatives(cond, kind: str, decrypted=False):
+    if cond.act not in COMPARISONS or cond.act == 'n':
+        return None
+    proto = cond.pth.partition('.')[0]
+    if (locations := _locations(proto, kind, decrypted)) is None:
+        return None
+    # Fields the compiler doesn't know still need their protocol
+    test = _field_test(cond) if cond.pth != proto else None
+    return [(case, tests + _at(test, offset)) for case, tests, offset in locations]
+
+
+# Returns [(case, tests, offset)] of every way the protocol's header can be placed in a frame of the kind, [] if it
+# can't be in such frames at all and None if it can't be located. Decrypted llc is behind a CCMP header
+def _locations(proto: str, kind: str, decrypted=False):
+    if kind == 'dot11':
+        if proto == 'dot11_header':
+            return [(None, (), 0)]
+        if proto == 'dot11_management':
+            return [(None, ((*_TYPE, '==', 0),), 24)]
+        if proto == 'llc':
+            if decrypted:
+                return None
+            return [(case, tuple(tests), offset) for case, (tests, offset) in enumerate(_LLC)]
+        if proto == 'ethernet':
+            return []
+        chain = _CHAIN
+    else:
+        if proto == 'ethernet':
+            return [(None, (), 0)]
+        if proto in ('radiotap', 'dot11_header', 'dot11_management', 'llc'):
+            return []
+        chain = _ETHERNET_CHAIN if proto in _ETHERNET_CHAIN else _CHAIN
+    if proto not in chain:
+        return None
+    parent, test, size = chain[proto]
+    if (locations := _locations(parent, kind, decrypted)) is None:
+        return None
+    return [(case, tests + _at(test, offset), offset + size if offset is not None and size is not None else None)
+            for case, tests, offset in locations]
+
+
+# The test moved to a header that starts at offset, as a tuple of tests. Headers that can't be located get none
+def _at(test, offset) -> tuple:
+    if test is None or offset is None:
+        return ()
+    size, k, *rest = test
+    return (size, offset + k, *rest),
+
+
+# Returns (size, offset, mask, operator, value) for the condition on a fixed-offset field, or None
+def _field_test(cond):
+    if cond.act not in _OPERATORS:
+        return None
+    values = cond.val if cond.act in SET_OPERATORS else (cond.val,)
+    if not all(isinstance(v, int) for v in values):
+        return None
+    if cond.pth == 'dot11_header.type_subtype':
+        # type_subtype is type << 4 | subtype, the byte holds subtype << 4 | type << 2. Only equality survives that
+        if cond.act not in ('==', '!=', *SET_OPERATORS):
+            return None
+        values = tuple((v & 15) << 4 | (v >> 4) << 2 if 0 <= v < 64 else -1 for v in values)
+        size, offset, mask = _TYPE_SUBTYPE
+    elif cond.pth in FIELDS:
+        size, offset, mask = FIELDS[cond.pth]
+        if mask:
+            # Masked bits are compared in place, so values are shifted to them. The bits below are 0 in A,
+            # which makes A > v << shift the same as A >= (v + 1) << shift
+            shift = (mask & -mask).bit_length() - 1
+            if cond.act in ('>', '<='):
+                return size, offset, mask, '>=' if cond.act == '>' else '<', cond.val + 1 << shift
+            values = tuple(v << shift for v in values)
+    else:
+        return None
+    if cond.act in SET_OPERATORS:
+        return size, offset, mask, cond.act, tuple(sorted(set(values)))
+    return size, offset, mask, cond.act, values[0]
+
+
+# Marks jumps to the next block until the block's length is known
+_FAIL = object()
+
+
+# Appends instructions of a test to the program. Passing goes on to the instruction after them
+def _emit(program: list, size, offset, mask, act, value, load=True):
+    jumps = max(len(value), 1) if act in SET_OPERATORS else 1
+    end = len(program) + jumps
+    if load:
+        end += 1 + (mask is not None)
+        program.append((LD, size, offset, _FAIL))
+        if mask is not None:
+            program.append((AND, mask))
+    if act == '==':
+        program.append((JEQ, value, end, _FAIL))
+    elif act == '!=':
+        program.append((JEQ, value, _FAIL, end))
+    elif act == '<':
+        program.append((JGE, value, _FAIL, end))
+    elif act == '<=':
+        program.append((JGT, value, _FAIL, end))
+    elif act == '>':
+        program.append((JGT, value, end, _FAIL))
+    elif act == '>=':
+        program.append((JGE, value, end, _FAIL))
+    elif not value:
+        program.append((JA, _FAIL if act == 'in' else end))
+    else:
+        for i, v in enumerate(value):
+            other = len(program) + 1 if i < len(value) - 1 else (_FAIL if act == 'in' else end)
+            program.append((JEQ, v, end, other) if act == 'in' else (JEQ, v, _FAIL, other))
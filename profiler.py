@@ -0,0 +1,139 @@
+import json
+from collections import Counter
+from time import perf_counter_ns
+
+from extensions import condition_key
+
+
+"""
+Opt-in instrumentation of a backend's packet loop. It counts, for every rule and condition, evaluations, passes,
+matches and time, and splits the loop's time into parsing, matching and actions.
+Backends use the wrappers from parse and match only when a profiler is given, so the loop costs nothing extra
+without it. Conditions are shared by rules in RuleNetwork, so a condition used by several rules has one set of counts.
+Conditions in == indexes are evaluated all at once by a dict lookup: each of them gets the lookups as evaluations
+and an equal share of the lookup time, so a condition that sits in several indexes is counted once per lookup
+"""
+class Profiler:
+    def __init__(self):
+        self.packets = 0
+        self.phases = {'parse': 0, 'match': 0, 'actions': 0}
+        # condition_key -> [evaluations, passes, ns]
+        self.conditions = {}
+        # id(rule) -> [rule, evaluations, matches, actions ns]
+        self.rules = {}
+        self.network = None
+
+    # Returns the packet constructor that counts parsing time
+    def parse(self, constructor):
+        phases = self.phases
+
+        def parse(*args):
+            t = perf_counter_ns()
+            pkt = constructor(*args)
+            phases['parse'] += perf_counter_ns() - t
+            self.packets += 1
+            return pkt
+        return parse
+
+    # Returns a function that works like network.match, counts every condition and times actions of matched rules
+    def match(self, network):
+        self.flush()
+        self.network = network
+        cond_stats = [[0, 0, 0] for _ in network.alphas]
+        self.table_stats = {}
+        self.bucket_stats = Counter()
+        self.cond_stats = cond_stats
+        stack = list(network.roots.values())
+        while stack:
+            node = stack.pop()
+            for _, table in node.dispatch:
+                self.table_stats[id(table)] = [0, 0, 0]
+                stack.extend(table.values())
+            stack.extend(node.children.values())
+        rule_stats = {}
+        for rule in network.rules:
+            rule_stats[id(rule)] = self.rules.setdefault(id(rule), [rule, 0, 0, 0])
+        phases = self.phases
+
+        def match(pkt):
+            t = perf_counter_ns()
+            matched = network.profile(pkt, cond_stats, self.table_stats, self.bucket_stats)
+            phases['match'] += perf_counter_ns() - t
+            timed = []
+            for rule in matched:
+                stats = rule_stats[id(rule)]
+                stats[2] += 1
+                timed.append(_TimedRule(rule, stats, phases))
+            return timed
+        return match
+
+    # Moves counts of the current network into totals and zeroes them, done before the network is replaced and on export
+    def flush(self):
+        network = self.network
+        if network is None:
+            return
+        for key, alpha in network.alphas.items():
+            total = self.conditions.setdefault(key, [0, 0, 0])
+            for i, n in enumerate(self.cond_stats[alpha.index]):
+                total[i] += n
+        for root in network.roots.values():
+            count = self.bucket_stats[id(root)]
+            stack = [root]
+            while stack:
+                node = stack.pop()
+                for i in node.rules:
+                    self.rules[id(network.rules[i])][1] += count
+                for alpha, table in node.dispatch:
+                    lookups, _, ns = self.table_stats[id(table)]
+                    for child in table.values():
+                        total = self.conditions.setdefault(condition_key(child.alpha), [0, 0, 0])
+                        total[0] += lookups
+                        total[2] += ns // len(table)
+                    stack.extend(table.values())
+                stack.extend(node.children.values())
+        for stats in self.cond_stats:
+            stats[:] = 0, 0, 0
+        for stats in self.table_stats.values():
+            stats[:] = 0, 0, 0
+        self.bucket_stats.clear()
+
+    def export(self):
+        self.flush()
+        rules = []
+        for rule, evaluations, matches, ns in self.rules.values():
+            conditions = []
+            for cond in rule.conditions:
+                c_evaluations, c_passes, c_ns = self.conditions.get(condition_key(cond), (0, 0, 0))
+                conditions.append({'pth': cond.pth, 'act': cond.act, 'val': repr(cond.val),
+                                   'evaluations': c_evaluations, 'passes': c_passes, 'ns': c_ns})
+            rules.append({'name': rule.name, 'evaluations': evaluations, 'matches': matches, 'actions_ns': ns,
+                          'conditions_ns': sum(c['ns'] for c in conditions), 'conditions': conditions})
+        return {'packets': self.packets, 'phases_ns': dict(self.phases), 'rules': rules}
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.export(), f, indent=4)
+
+
+# Stands in for a matched rule in the packet loop and times its add (or do, in backends that call it directly)
+class _TimedRule:
+    __slots__ = 'rule', 'stats', 'phases'
+
+    def __init__(self, rule, stats, phases):
+        self.rule = rule
+        self.stats = stats
+        self.phases = phases
+
+    def add(self, pkt):
+        t = perf_counter_ns()
+        self.rule.add(pkt)
+        t = perf_counter_ns() - t
+        self.stats[3] += t
+        self.phases['actions'] += t
+
+    def do(self, pkt):
+        t = perf_counter_ns()
+        self.rule.do(pkt)
+        t = perf_counter_ns() - t
+        self.stats[3] += t
+        self.phases['actions'] += t
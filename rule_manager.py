@@ -0,0 +1,81 @@
+import json
+import os
+from time import monotonic
+
+from extensions import Rule
+
+# Seconds between checks of the rules file's modification time
+CHECK_INTERVAL = 1
+
+
+"""
+Keeps rules loaded from a json file and reloads them when the file changes.
+Rules are keyed by their json, a rule that didn't change keeps its Rule object with its times, counter, inactive_until
+and groups, only new or edited rules are created. Backends bind their rule preparation (decoding of values) and call
+poll between packets, rebuilding their matcher when it returns something. New rules are prepared before they replace
+the old set, so a file with a rule the backend can't take leaves the old rules running
+"""
+class RuleManager:
+    def __init__(self, path):
+        self.path = path
+        self.rules = []
+        self.by_key = {}
+        self.mtime = None
+        # Called for every created rule on reload, see bind
+        self.prepare = None
+        self.next_check = monotonic() + CHECK_INTERVAL
+        self.reload()
+
+    # prepare(rule) converts a new rule for the backend and raises if it can't
+    def bind(self, prepare):
+        self.prepare = prepare
+
+    # Reads the file again and returns Rule objects that were created for new or changed rules
+    def reload(self):
+        first = self.mtime is None
+        self.mtime = os.stat(self.path).st_mtime_ns
+        with open(self.path) as f:
+            dicts = json.load(f)
+        old = {key: list(rules) for key, rules in self.by_key.items()}
+        by_key = {}
+        rules = []
+        created = []
+        for d in dicts:
+            key = json.dumps(d, sort_keys=True)
+            if old.get(key):
+                rule = old[key].pop(0)
+            else:
+                rule = Rule(d)
+                created.append(rule)
+            by_key.setdefault(key, []).append(rule)
+            rules.append(rule)
+        if self.prepare:
+            for rule in created:
+                self.prepare(rule)
+        removed = len(self.rules) - (len(rules) - len(created))
+        self.rules = rules
+        self.by_key = by_key
+        if not first:
+            print(f'Rules reloaded from {self.path}: {len(created)} new, {removed} removed')
+        return created
+
+    # Checks the file at most once in CHECK_INTERVAL. Returns None if rules didn't change,
+    # otherwise a list of created rules, it's empty if rules were only removed
+    def poll(self):
+        now = monotonic()
+        if now < self.next_check:
+            return None
+        self.next_check = now + CHECK_INTERVAL
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+        if mtime == self.mtime:
+            return None
+        try:
+            return self.reload()
+        except Exception as e:
+            # A half-written file or a rule with a value the backend can't decode, old rules stay until it's changed again
+            self.mtime = mtime
+            print(f'WARNING: could not reload {self.path}: {e!r}')
+            return None
@@ -2,7 +2,7 @@ import json
 import timeit
 from scapy.all import rdpcap
 
-from extensions import Rule, COMPARISONS, mac_to_bytes
+from extensions import Rule, COMPARISONS, mac_to_bytes, decode_value
 
 fields_values_decoder = {
     "dhcp.client_mac": lambda a: mac_to_bytes(a) + b'\x00'*10,
@@ -53,7 +53,7 @@ def do(path, report):
         rules = [Rule(i) for i in json.load(f)]
     for rule in rules:
         for cond in rule.conditions:
-            cond.val = fields_values_decoder.get(cond.pth, lambda a: a)(cond.val)
+            cond.val = decode_value(cond, fields_values_decoder)
             cond.pth = fields_names_decoder.get(cond.pth, cond.pth)
     start = timeit.default_timer()
     s = rdpcap(path)
@@ -1,10 +1,16 @@
 import struct
 import extensions
 
+# --- generated from pcc_in.json: header ---
+_HEADER = struct.Struct('!HHBBH6sI6sI')
+# --- end of generated header ---
+
 
 class Arp:
+    # --- generated from pcc_in.json: slots ---
     __slots__ = 'hardware_type', 'protocol_type', 'hardware_size', 'protocol_size', 'opcode', 'sender_mac', \
                 'sender_ip', 'target_mac', 'target_ip', 'payload'
+    # --- end of generated slots ---
     name = 'arp'
 
     def __init__(self, hardware_type, protocol_type, hardware_size, protocol_size, opcode, sender_mac, sender_ip,
@@ -24,18 +30,21 @@ class Arp:
     def summary(self):
         return f'ARP {extensions.int_to_ipv4(self.sender_ip)} -> {extensions.int_to_ipv4(self.target_ip)}'
 
+    # --- generated from pcc_in.json: from_raw ---
     @classmethod
     def from_raw(cls, data):
-        if len(data) < 18:
+        if len(data) < 28:
             return extensions.MalformedPacketException(f"ARP requires at least 28 bytes, got {len(data)}")
 
+        # get values for fields the packet has
         hardware_type, protocol_type, hardware_size, protocol_size, opcode, sender_mac, sender_ip, target_mac, \
-        target_ip = struct.unpack('!HHBBH6sI6sI', data[:28])
-
+        target_ip = _HEADER.unpack_from(data)
         sender_mac = int.from_bytes(sender_mac, 'big')
         target_mac = int.from_bytes(target_mac, 'big')
 
+        # if we know the next proto, parse the payload
         payload = data[28:]
 
         return cls(hardware_type, protocol_type, hardware_size, protocol_size, opcode, sender_mac, sender_ip,
                    target_mac, target_ip, payload)
+    # --- end of generated from_raw ---
@@ -1,6 +1,11 @@
 import struct
 import extensions
 
+_HEADER = struct.Struct('!BBBBIH2sIIII6s10s64s128s')
+_CLIENT_IDENTIFIER = struct.Struct('!B6s')
+_CFQDN = struct.Struct('!sBB')
+_COOKIE = struct.Struct('4s')
+
 
 class Dhcp:
     __slots__ = 'opcode', 'hardware_type', 'hardware_length', 'hops', 'transaction_id', 'seconds_elapsed', 'client_ip',\
@@ -49,7 +54,7 @@ class Dhcp:
 
         opcode, hardware_type, hardware_length, hops, transaction_id, seconds_elapsed, flags, client_ip, your_ip, \
         server_ip, gateway_ip, client_mac, client_padding, server_host_name, boot_file = \
-            struct.unpack('!BBBBIH2sIIII6s10s64s128s', data[:236])
+            _HEADER.unpack_from(data)
 
         flags = Flags.from_raw(flags)
         client_mac = int.from_bytes(client_mac, 'big')
@@ -58,7 +63,7 @@ class Dhcp:
         payload = b''
 
         if data:
-            magic_cookie = struct.unpack('!4s', data[:4])[0]
+            magic_cookie = _COOKIE.unpack_from(data)[0]
             if magic_cookie == b'\x63\x82\x53\x63':  # Magic number identifies that DHCP (not BOOTP) options follow
                 options = Options.from_raw(data[4:])
 
@@ -128,13 +133,13 @@ class Options:
         additional_dns = []
     
         while data:
-            option = struct.unpack('!B', data[:1])[0]
+            option = data[0]
     
             if option == 255:
                 break
             else:
-                length = struct.unpack('!B', data[1:2])[0]
-                option_body = struct.unpack(f'!{length}s', data[2:length + 2])[0]
+                length = data[1]
+                option_body = extensions.read_bytes(data, 2, length)
                 if option == 1:
                     subnet_mask = int.from_bytes(option_body, 'big')
                 elif option == 3:
@@ -182,7 +187,7 @@ class ClientIdentifier:
 
     @classmethod
     def from_raw(cls, data):
-        hardware_type, client_mac_address = struct.unpack('!B6s', data[:7])
+        hardware_type, client_mac_address = _CLIENT_IDENTIFIER.unpack_from(data)
         client_mac_address = int.from_bytes(client_mac_address, 'big')
 
         return cls(hardware_type, client_mac_address)
@@ -210,7 +215,7 @@ class ClientFullyQualifiedDomainName:
 
     @classmethod
     def from_raw(cls, data):
-        flags, a_rr_result, ptr_rr_result = struct.unpack('!sBB', data[:3])
+        flags, a_rr_result, ptr_rr_result = _CFQDN.unpack_from(data)
         flags = CFQDNFlags.from_raw(flags)
         client_name = data[3:]
 
@@ -4,6 +4,12 @@ import extensions
 from .dot11_management import Dot11Management
 from .llc import Llc
 
+_HEADER = struct.Struct('!2sH6s')
+_ADDRESSES = struct.Struct('!6s6sH')
+_MAC = struct.Struct('6s')
+_QOS_CONTROL = struct.Struct('2s')
+_CCMP = struct.Struct('8s')
+
 
 class Dot11Header:
     __slots__ = 'frame_control', 'duration', 'receiver', 'transmitter', 'destination', 'sequence_number', \
@@ -138,7 +144,7 @@ class Dot11Header:
             return extensions.MalformedPacketException(f".11 requires at least 10 bytes, got {len(data)}")
 
         # get values for fields the packet has
-        frame_control, duration, receiver = struct.unpack('!2sH6s', data[:10])
+        frame_control, duration, receiver = _HEADER.unpack_from(data)
         frame_control = FrameControl.from_raw(frame_control)
         receiver = int.from_bytes(receiver, 'big')
         transmitter = None
@@ -156,12 +162,12 @@ class Dot11Header:
         elif frame_control.type == 1 and (frame_control.subtype == 8 or
                                           frame_control.subtype == 10 or
                                           frame_control.subtype == 11):
-            transmitter = int.from_bytes(struct.unpack('!6s', data[10:16])[0], 'big')
+            transmitter = int.from_bytes(_MAC.unpack_from(data, 10)[0], 'big')
             last = 16
         else:
             # TODO: remove exception when we account for all frame types
             try:
-                transmitter, destination, sequence_fragment = struct.unpack('!6s6sH', data[10:24])
+                transmitter, destination, sequence_fragment = _ADDRESSES.unpack_from(data, 10)
             except Exception:
                 print(f'Exception in dot11_header.py: type: {frame_control.type} subtype: {frame_control.subtype}')
             transmitter = int.from_bytes(transmitter, 'big')
@@ -169,7 +175,7 @@ class Dot11Header:
             sequence_number = sequence_fragment >> 4
             fragment_number = sequence_fragment & 15
             if frame_control.to_ds and frame_control.from_ds:
-                address_4 = int.from_bytes(struct.unpack('!6s', data[24:30])[0], 'big')
+                address_4 = int.from_bytes(_MAC.unpack_from(data, 24)[0], 'big')
                 last = 30
             else:
                 last = 24
@@ -181,10 +187,10 @@ class Dot11Header:
             header.payload = Dot11Management.from_raw(data, frame_control.subtype)
         elif frame_control.type == 2 and frame_control.subtype in (0, 8):
             if frame_control.subtype == 8:
-                header.qos_control = QosControl.from_raw(struct.unpack('!2s', data[last:last + 2])[0])
+                header.qos_control = QosControl.from_raw(_QOS_CONTROL.unpack_from(data, last)[0])
                 last += 2
             if frame_control.protected:
-                header.ccmp = Ccmp.from_raw(struct.unpack('<8s', data[last:last + 8])[0])
+                header.ccmp = Ccmp.from_raw(_CCMP.unpack_from(data, last)[0])
                 last += 8
             else:
                 if frame_control.subtype == 0 or (frame_control.subtype == 8 and header.qos_control.payload_type == 0):
@@ -1,12 +1,20 @@
 import struct
 import extensions
 
-from .arp import Arp
+# --- generated from pcc_in.json: header ---
 from .ipv4 import Ipv4
+from .arp import Arp
+from .dot1x_authentication import Dot1xAuthentication
+
+_HEADER = struct.Struct('!6s6sH')
+_NEXT = {0x0800: Ipv4, 0x0806: Arp, 0x888e: Dot1xAuthentication}
+# --- end of generated header ---
 
 
 class Ether:
+    # --- generated from pcc_in.json: slots ---
     __slots__ = 'destination', 'source', 'length', 'payload'
+    # --- end of generated slots ---
     name = 'ether'
 
     def __init__(self, destination, source, length, payload=None):
@@ -19,19 +27,21 @@ class Ether:
     def summary(self):
         return f"Ether {extensions.get_bytes_to_mac(self.source)} -> {extensions.get_bytes_to_mac(self.destination)}"
 
+    # --- generated from pcc_in.json: from_raw ---
     @classmethod
     def from_raw(cls, data):
         if len(data) < 14:
             return extensions.MalformedPacketException(f"Ethernet requires at least 14 bytes, got {len(data)}")
-        
-        destination, source, length = struct.unpack('!6s6sH', data[:14])
+
+        # get values for fields the packet has
+        destination, source, length = _HEADER.unpack_from(data)
         destination = int.from_bytes(destination, 'big')
         source = int.from_bytes(source, 'big')
 
+        # if we know the next proto, parse the payload
         payload = data[14:]
-        if length == 2048:
-            payload = Ipv4.from_raw(payload)
-        elif length == 0x806:
-            payload = Arp.from_raw(payload)
+        if (next_proto := _NEXT.get(length)) is not None:
+            payload = next_proto.from_raw(payload)
 
         return cls(destination, source, length, payload)
+    # --- end of generated from_raw ---
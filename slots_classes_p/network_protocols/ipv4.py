@@ -1,12 +1,19 @@
 import struct
 import extensions
 
+# --- generated from pcc_in.json: header ---
 from .udp import Udp
 
+_HEADER = struct.Struct('!BBHHHBBHII')
+_NEXT = {17: Udp}
+# --- end of generated header ---
+
 
 class Ipv4:
+    # --- generated from pcc_in.json: slots ---
     __slots__ = 'version', 'ihl', 'dscp', 'ecn', 'total_length', 'identification', 'flags', 'fragment_offset', 'ttl', \
                 'protocol', 'header_checksum', 'source', 'destination', 'options', 'payload'
+    # --- end of generated slots ---
     name = 'ipv4'
 
     def __init__(self, version, ihl, dscp, ecn, total_length, identification, flags, fragment_offset, ttl, protocol,
@@ -31,37 +38,36 @@ class Ipv4:
     def summary(self):
         return f"{extensions.int_to_ipv4(self.source)} -> {extensions.int_to_ipv4(self.destination)}"
 
+    # --- generated from pcc_in.json: from_raw ---
     @classmethod
     def from_raw(cls, data):
         if len(data) < 20:
-            return extensions.MalformedPacketException(f'IPv4 requires at least 20 bytes, got {len(data)}')
-
-        vide, total_length, identification, flags_fr_offset, ttl, protocol, header_checksum, source, destination \
-            = struct.unpack('!2sHH2sBBH4s4s', data[:20])
+            return extensions.MalformedPacketException(f"IPv4 requires at least 20 bytes, got {len(data)}")
 
-        version = vide[0] >> 4
-        ihl = vide[0] & 15
-        dscp = vide[1] >> 6
-        ecn = vide[1] & 3
-        flags = flags_fr_offset[0] >> 5
-        flags_fr_offset = bytearray(flags_fr_offset)
-        flags_fr_offset[0] = flags_fr_offset[0] & 31
-        fragment_offset = int.from_bytes(flags_fr_offset, 'big')
-        source = int.from_bytes(source, 'big')
-        destination = int.from_bytes(destination, 'big')
+        # get values for fields the packet has
+        version_ihl, dscp_ecn, total_length, identification, flags_fragment_offset, ttl, protocol, header_checksum, \
+        source, destination = _HEADER.unpack_from(data)
+        version = version_ihl >> 4
+        ihl = version_ihl & 15
+        dscp = dscp_ecn >> 2
+        ecn = dscp_ecn & 3
+        flags = flags_fragment_offset >> 13
+        fragment_offset = flags_fragment_offset & 0x1fff
+        header_length = ihl * 4
         options = None
+        if header_length > 20:
+            if len(data) >= header_length:
+                options = (data[20:header_length],)
+            else:
+                print(f"DEBUG got options of incorrect size: expected {header_length - 20} bytes, "
+                      f"got {len(data) - 20}")
+                options = (data[20:],)
 
-        if ihl > 5:
-            options_length = (ihl - 5) * 4
-            try:
-                options = struct.unpack(f'{options_length}s', data[20:20+options_length])
-            except struct.error as e:
-                print(f"DEBUG got options of incorrect size: {e}")
-                options = struct.unpack(f'{len(data)-20}s', data[20:])
-
-        payload = data[ihl*4:]
-        if protocol == 17:
-            payload = Udp.from_raw(payload)
+        # if we know the next proto, parse the payload
+        payload = data[header_length:]
+        if (next_proto := _NEXT.get(protocol)) is not None:
+            payload = next_proto.from_raw(payload)
 
         return cls(version, ihl, dscp, ecn, total_length, identification, flags, fragment_offset, ttl, protocol,
                    header_checksum, source, destination, options, payload)
+    # --- end of generated from_raw ---
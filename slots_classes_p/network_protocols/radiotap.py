@@ -3,6 +3,13 @@ import extensions
 
 from .dot11_header import Dot11Header
 
+_HEADER = struct.Struct('<BBHI')
+_PRESENT = struct.Struct('<I')
+_CHANNEL = struct.Struct('<H2s')
+_FLAGS = struct.Struct('s')
+_RX_FLAGS = struct.Struct('2s')
+_MCS = struct.Struct('<BBB')
+
 
 class Radiotap:
     __slots__ = 'version', 'pad', 'length', 'present', 'data_rate', 'channel_frequency', 'dbm_antenna_signal', \
@@ -53,41 +60,42 @@ class Radiotap:
         
         # get values for fields the packet has
         # Unpacks the first present dword
-        version, pad, length, present = struct.unpack('<BBHI', data[:8])
+        version, pad, length, present = _HEADER.unpack_from(data)
         c = '0' * (32 - len(a := bin(present)[2:])) + a
 
         # Currently a placeholder for other present dwords
         c_else = '0' * (32 - len(a := bin(present)[2:])) + a
         last = 8
         while c_else[0] == '1':
-            present_else = struct.unpack('<I', data[last:last+4])[0]
+            present_else = _PRESENT.unpack_from(data, last)[0]
             c_else = '0' * (32 - len(a := bin(present_else)[2:])) + a
             last += 4
 
-        radio_data = data[last:]
+        # Offset of the current radio field
+        pos = last
 
         if c[30] == '1':
-            flags = Flags.from_raw(struct.unpack('<s', radio_data[:1])[0])
-            radio_data = radio_data[1:]
+            flags = Flags.from_raw(_FLAGS.unpack_from(data, pos)[0])
+            pos += 1
         if c[29] == '1':
-            data_rate = struct.unpack('<B', radio_data[:1])[0]
-        radio_data = radio_data[1:]
+            data_rate = data[pos]
+        pos += 1
         if c[28] == '1':
-            channel_frequency, channel_flags = struct.unpack('<H2s', radio_data[:4])
+            channel_frequency, channel_flags = _CHANNEL.unpack_from(data, pos)
             channel_flags = ChannelFlags.from_raw(channel_flags)
-            radio_data = radio_data[4:]
+            pos += 4
         if c[26] == '1':
-            dbm_antenna_signal = struct.unpack('<b', radio_data[:1])[0]
-            radio_data = radio_data[1:]
+            dbm_antenna_signal = (data[pos] ^ 128) - 128  # signed byte
+            pos += 1
         if c[20] == '1':
-            antenna = struct.unpack('<B', radio_data[:1])[0]
-            radio_data = radio_data[1:]
+            antenna = data[pos]
+            pos += 1
         if c[17] == '1':
-            rx_flags = RxFlags.from_raw(struct.unpack('<2s', radio_data[:2])[0])
-            radio_data = radio_data[2:]
+            rx_flags = RxFlags.from_raw(_RX_FLAGS.unpack_from(data, pos)[0])
+            pos += 2
         if c[12] == '1':
-            mcs_information = struct.unpack('<BBB', radio_data[:3])
-            radio_data = radio_data[3:]
+            mcs_information = _MCS.unpack_from(data, pos)
+            pos += 3
 
         if flags.fcs_at_end:
             data = data[:-4]
@@ -1,11 +1,18 @@
 import struct
 import extensions
 
+# --- generated from pcc_in.json: header ---
 from .dhcp import Dhcp
 
+_HEADER = struct.Struct('!HHHH')
+_NEXT = {67: Dhcp, 68: Dhcp}
+# --- end of generated header ---
+
 
 class Udp:
+    # --- generated from pcc_in.json: slots ---
     __slots__ = 'source_port', 'destination_port', 'length', 'checksum', 'payload'
+    # --- end of generated slots ---
     name = 'udp'
 
     def __init__(self, source_port, destination_port, length, checksum, payload=None):
@@ -19,16 +26,20 @@ class Udp:
     def summary(self):
         return False
 
+    # --- generated from pcc_in.json: from_raw ---
     @classmethod
     def from_raw(cls, data):
         if len(data) < 8:
             return extensions.MalformedPacketException(f"UDP requires at least 8 bytes, got {len(data)}")
-        
-        source_port, destination_port, length, checksum = struct.unpack('!HHHH', data[:8])
 
+        # get values for fields the packet has
+        source_port, destination_port, length, checksum = _HEADER.unpack_from(data)
+
+        # if we know the next proto, parse the payload
         data = data[:length]
         payload = data[8:]
-        if destination_port == 67 or destination_port == 68:
-            payload = Dhcp.from_raw(payload)
+        if (next_proto := _NEXT.get(destination_port)) is not None:
+            payload = next_proto.from_raw(payload)
 
         return cls(source_port, destination_port, length, checksum, payload)
+    # --- end of generated from_raw ---